@@ -0,0 +1,353 @@
+import Trace_File
+import Trace_Pipeline
+
+try:
+    import numpy as np
+except ImportError:   #numpy is optional, the simulator falls back to the per-line path without it
+    np = None
+
+'''
+This file contains the BatchEngine Class which simulates the cache hierarchy a chunk of the trace at a time using NumPy.
+
+Each chunk is decoded into an array of addresses, which is passed through the hierarchy one cache level at a time: every level
+works out which accesses in the chunk hit, and only the misses (in their original order) are passed down to the next level. This
+gives exactly the same counters as passing each address through the whole hierarchy in turn.
+
+The sets of a set-associative level are independent (unless round robin uses the original counter shared by every set), so the accesses
+are grouped by set and the sets are stepped through in lockstep: each round looks up the next access of every set with array operations
+on the level's own tags (a row of ways per set), with least recently used kept as a last-use stamp for each way while the engine runs.
+The few busiest sets left once most have run out of accesses are finished one access at a time. The replacement state the Cache_Level
+keeps between accesses (linked lists of ways for lru and the lowest-count masks for lfu) is rebuilt in its arrays when the engine finishes.
+'''
+
+CHUNK_SIZE = 1 << 22   #number of bytes of the text trace file decoded at a time
+ROUND_MIN_SETS = 64   #fewest sets worth stepping through in lockstep, the rest of the accesses of busier sets are simulated one at a time
+BINARY_CHUNK_SIZE = 1 << 20   #number of records of the binary trace file simulated at a time
+
+
+#returns whether the batch engine can be used (it requires NumPy)
+def is_available():
+    return np is not None
+
+
+class BatchEngine:
+    def __init__(self, cache_hierarchy, shards=None):
+        self.cache_hierarchy = cache_hierarchy   #list of the Cache_Level objects in the hierarchy
+        self.mem_access = 0   #number of main memory accesses made by the chunks simulated so far
+        self.direct_state = {}   #cache store (tags and valid bits) of each direct mapped level as NumPy arrays (views of the level's own arrays)
+        self.set_state = {}   #tags, valid counts and replacement state (stamps, counts or counters) of each set-associative level as NumPy arrays
+        self.clock = 0   #stamp given to the cache lines used in the current round of lru accesses
+        self.sharded = {}   #levels simulated across several worker processes
+
+        for cache in cache_hierarchy:
+            shard_num = (shards or {}).get(cache, 1)   #number of worker processes asked for the level
+            if shard_num > 1:
+                if cache.kind != "full" and cache.has_independent_sets():
+                    import Sharded_Level   #imported here so multiprocessing is only loaded when a level is sharded
+                    self.sharded[cache] = Sharded_Level.ShardedLevel(cache, shard_num)
+                    continue
+                print(f"{cache.name}: the sets of this cache level aren't independent (set 'per_set_rr' for round robin), so it isn't sharded")
+
+            if cache.kind == "direct":   #the arrays are updated in place, so the level needs nothing written back
+                self.direct_state[cache] = (np.frombuffer(cache.cache, dtype=np.uint64), np.frombuffer(cache.valid, dtype=bool))
+            elif cache.kind != "full" and cache.has_independent_sets():
+                self.set_state[cache] = self.load_sets(cache)
+
+    #reads the trace file a chunk at a time and simulates each chunk (collapsing the runs of accesses to the same line of the first level if asked)
+    def trace_program(self, trace_file, compact=False):
+        if Trace_File.is_binary_trace(trace_file):
+            with Trace_File.TraceReader(trace_file) as reader:
+                if reader.flags & Trace_File.COMPACTED:   #the runs have already been collapsed
+                    for records in reader.chunks(BINARY_CHUNK_SIZE):
+                        self.mem_access += self.simulate_chunk(records["address"], records["size"])
+                    return
+
+        for addresses in read_chunks(trace_file):
+            if compact and self.cache_hierarchy:
+                self.mem_access += self.simulate_chunk(*compact_chunk(addresses, self.cache_hierarchy[0].offset_bits))
+            else:
+                self.mem_access += self.simulate_chunk(addresses)
+
+    #passes an array of addresses through each cache level in turn, returning the number of main memory accesses
+    #(if the number of repeats of each address is given, every access after the first is applied to the first level as a hit)
+    def simulate_chunk(self, addresses, repeats=None):
+        if repeats is not None and self.cache_hierarchy:
+            first_level = self.cache_hierarchy[0]
+            first_level.hits += int(repeats.sum()) - addresses.size
+            if first_level.replacement_policy != "lfu":   #only the access counts of least frequently used need the repeats
+                repeats = None
+
+        for cache in self.cache_hierarchy:
+            if addresses.size == 0:
+                break
+
+            hits = self.simulate_level(cache, addresses, repeats)
+            addresses = addresses[~hits]   #only the misses go to the next cache level
+            repeats = None   #the runs only repeat in the first level
+
+        return int(addresses.size)
+
+    #resolves the hits and misses of one cache level, returning whether each access was a hit
+    #(if the number of accesses in the run of each address is given, they are all added to the access count of its cache line for lfu)
+    def simulate_level(self, cache, addresses, repeats=None):
+        if cache in self.sharded:
+            return self.sharded[cache].simulate_chunk(addresses, repeats)
+        elif cache.kind == "direct":
+            return self.simulate_direct(cache, addresses)
+        elif cache in self.set_state:
+            return self.simulate_sets(cache, addresses, repeats)
+        else:
+            return self.simulate_associative(cache, addresses, repeats)
+
+    #resolves the hits and misses of a direct mapped level with array operations
+    def simulate_direct(self, cache, addresses):
+        tags, valid = self.direct_state[cache]
+        chunk_tags = addresses >> np.uint64(cache.tag_shift)   #tag of each access
+        chunk_index = ((addresses >> np.uint64(cache.offset_bits)) & np.uint64(cache.index_mask)).astype(np.intp)   #cache line of each access
+
+        order = group_order(chunk_index, cache.line_num)   #groups the accesses by cache line, keeping them in trace order within each line
+        sorted_index = chunk_index[order]
+        sorted_tags = chunk_tags[order]
+
+        #the tag in the cache line before each access is the tag of the previous access to the same line (or what was stored before the chunk)
+        first = np.ones(sorted_index.size, dtype=bool)
+        first[1:] = sorted_index[1:] != sorted_index[:-1]
+        previous_tags = np.empty_like(sorted_tags)
+        previous_tags[1:] = sorted_tags[:-1]
+        previous_tags[first] = tags[sorted_index[first]]
+        previous_valid = np.ones(sorted_index.size, dtype=bool)
+        previous_valid[first] = valid[sorted_index[first]]
+
+        hits = np.empty(addresses.size, dtype=bool)
+        hits[order] = previous_valid & (previous_tags == sorted_tags)
+
+        last = np.ones(sorted_index.size, dtype=bool)   #the last access to each cache line leaves its tag stored
+        last[:-1] = first[1:]
+        tags[sorted_index[last]] = sorted_tags[last]
+        valid[sorted_index[last]] = True
+
+        hit_count = int(np.count_nonzero(hits))
+        cache.hits += hit_count
+        cache.misses += addresses.size - hit_count
+        return hits
+
+    #passes the accesses of a fully-associative level (or a set-associative one with the shared round robin counter) through the Cache_Level in a tight loop
+    def simulate_associative(self, cache, addresses, repeats=None):
+        hits = np.empty(addresses.size, dtype=bool)
+        hits[:] = cache.search_stream((addresses >> np.uint64(cache.offset_bits)).tolist(), None if repeats is None else repeats.tolist())   #the cache line of each access, in trace order
+        return hits
+
+    #returns views of the tags, valid counts and replacement state of a set-associative level, turning its lru linked lists into stamps
+    def load_sets(self, cache):
+        shape = (cache.set_num, cache.set_size)
+        tags = np.frombuffer(cache.cache, dtype=np.uint64).reshape(shape)
+        fill = np.frombuffer(cache.set_fill, dtype=np.uint16)
+
+        if cache.replacement_policy == "lfu":
+            replacement = np.frombuffer(cache.meta_data_cache, dtype=np.uint64).reshape(shape)   #access counts, updated in place
+        elif cache.replacement_policy == "rr":
+            replacement = np.frombuffer(cache.rr_counter, dtype=f"u{cache.rr_counter.itemsize}")   #counter of each set, updated in place
+        else:
+            replacement = np.zeros(shape, dtype=np.int64)   #round in which each cache line was last used
+            for index_int in np.flatnonzero(fill).tolist():   #follows the order of use of every set holding anything
+                way = cache.lru_head[index_int]
+                for stamp in range(cache.set_fill[index_int]):
+                    replacement[index_int, way] = stamp
+                    way = cache.lru_next[index_int * cache.set_size + way]
+            self.clock = max(self.clock, cache.set_size)
+
+        return tags, fill, replacement
+
+    #resolves the hits and misses of a set-associative level with independent sets, stepping through the sets in lockstep
+    def simulate_sets(self, cache, addresses, repeats=None):
+        tags, fill, replacement = self.set_state[cache]
+        set_size = cache.set_size
+        policy = cache.replacement_policy
+        ways = np.arange(set_size)
+
+        lines = addresses >> np.uint64(cache.offset_bits)   #cache line of each access (its tag and set index together)
+        sets = (lines & np.uint64(cache.index_mask)).astype(np.intp)
+        order = group_order(sets, cache.set_num)   #groups the accesses by set, keeping them in trace order within each set
+        sorted_lines = lines[order]
+        sorted_sets = sets[order]
+        sorted_repeats = None if repeats is None else repeats[order].astype(np.uint64)   #added to the access counts (lfu)
+
+        starts = np.flatnonzero(np.concatenate(([True], sorted_sets[1:] != sorted_sets[:-1])))   #first access of each set
+        counts = np.diff(np.append(starts, sorted_sets.size))   #number of accesses to each set
+        busiest = np.argsort(-counts, kind="stable")   #busiest sets first, so the sets still with accesses in each round come first
+        starts = starts[busiest]
+        counts = counts[busiest]
+        group_sets = sorted_sets[starts]
+
+        #copies of the touched sets in the same order, so the sets with an access in each round are the first rows
+        set_tags = tags[group_sets]
+        set_fill = fill[group_sets].astype(np.intp)
+        set_replacement = replacement[group_sets].astype(np.intp) if policy == "rr" else replacement[group_sets]
+        rows = np.arange(group_sets.size)
+
+        sorted_hits = np.empty(sorted_lines.size, dtype=bool)
+        active = counts.size   #number of sets with an access in the current round
+        step = 0
+        while True:
+            while active and counts[active - 1] <= step:
+                active -= 1
+            if active < ROUND_MIN_SETS:
+                break
+
+            accesses = starts[:active] + step   #the next access of each of those sets
+            line = sorted_lines[accesses]
+            filled = set_fill[:active]
+            row = rows[:active]
+
+            match = (set_tags[:active] == line[:, None]) & (ways < filled[:, None])   #valid cache lines holding the tag bits
+            hit = match.any(axis=1)
+            empty = filled < set_size   #misses in sets that aren't full yet fill the next cache line
+
+            if policy != "rr":
+                victim = set_replacement[:active].argmin(axis=1)   #least recently used cache line, or lowest cache line with the lowest count
+            else:
+                victim = set_replacement[:active].copy()
+                set_replacement[:active] = np.where(hit | empty, victim, (victim + 1) % set_size)   #the counter moves on when a cache line is replaced
+            way = np.where(hit, match.argmax(axis=1), np.where(empty, filled, victim))
+
+            set_tags[row, way] = line
+            filled += ~hit & empty
+            if policy == "lru":
+                set_replacement[row, way] = self.clock
+                self.clock += 1
+            elif policy == "lfu":
+                set_replacement[row, way] += np.uint64(1) if sorted_repeats is None else sorted_repeats[accesses]
+
+            sorted_hits[accesses] = hit
+            step += 1
+
+        tags[group_sets] = set_tags
+        fill[group_sets] = set_fill
+        replacement[group_sets] = set_replacement
+
+        for group in range(active):   #the busiest sets finish the rest of their accesses one at a time
+            start = starts[group] + step
+            end = starts[group] + counts[group]
+            sorted_hits[start:end] = self.simulate_set_tail(cache, int(group_sets[group]), sorted_lines[start:end].tolist(),
+                                                            None if sorted_repeats is None else sorted_repeats[start:end].tolist())
+
+        hits = np.empty(addresses.size, dtype=bool)
+        hits[order] = sorted_hits   #puts the hits back in trace order
+        hit_count = int(np.count_nonzero(hits))
+        cache.hits += hit_count
+        cache.misses += addresses.size - hit_count
+        return hits
+
+    #simulates a stream of accesses (cache line numbers) to one set of a set-associative level one at a time, returning whether each one was a hit
+    def simulate_set_tail(self, cache, index_int, lines, repeats=None):
+        tags, fill, replacement = self.set_state[cache]
+        set_size = cache.set_size
+        policy = cache.replacement_policy
+        row = tags[index_int].tolist()
+        filled = int(fill[index_int])
+        state = replacement[index_int].tolist()   #stamps or counts of the ways, or the round robin counter
+        clock = self.clock
+        results = []
+
+        for position, line in enumerate(lines):
+            way = row.index(line) if line in row else set_size
+            if way < filled:   #the ways past the valid ones may still hold old tags
+                results.append(True)
+            else:
+                results.append(False)
+                if filled < set_size:
+                    way = filled
+                    filled += 1
+                elif policy == "rr":
+                    way = state
+                    state = way + 1 if way + 1 < set_size else 0
+                else:
+                    way = state.index(min(state))   #least recently used, or lowest cache line with the lowest count
+                row[way] = line
+
+            if policy == "lru":
+                state[way] = clock
+                clock += 1
+            elif policy == "lfu":
+                state[way] += 1 if repeats is None else repeats[position]
+
+        tags[index_int] = row
+        fill[index_int] = filled
+        replacement[index_int] = state
+        self.clock = clock
+        return results
+
+    #writes the replacement state only kept by the engine back to a set-associative level
+    def store_sets(self, cache):
+        tags, fill, replacement = self.set_state[cache]
+        valid = np.arange(cache.set_size) < fill[:, None].astype(np.intp)
+        used = np.flatnonzero(fill)   #sets holding anything
+
+        if cache.replacement_policy == "lru":   #links the ways of each set in order of their stamps, writing to the level's own arrays
+            shape = (cache.set_num, cache.set_size)
+            lru_prev = np.frombuffer(cache.lru_prev, dtype=np.uint8).reshape(shape)
+            lru_next = np.frombuffer(cache.lru_next, dtype=np.uint8).reshape(shape)
+            lru_head = np.frombuffer(cache.lru_head, dtype=np.uint8)
+            lru_tail = np.frombuffer(cache.lru_tail, dtype=np.uint8)
+
+            order = np.argsort(np.where(valid, replacement, np.iinfo(np.int64).max), axis=1)[used]   #ways of each set from least to most recently used
+            filled = fill[used].astype(np.intp)
+            lru_head[used] = order[:, 0]
+            lru_tail[used] = order[np.arange(used.size), filled - 1]
+            for position in range(cache.set_size - 1):
+                linked = position + 1 < filled
+                lru_next[used[linked], order[linked, position]] = order[linked, position + 1]
+                lru_prev[used[linked], order[linked, position + 1]] = order[linked, position]
+        elif cache.replacement_policy == "lfu":   #the ways with the lowest count in each full set
+            full = fill == cache.set_size
+            lowest = replacement == replacement.min(axis=1)[:, None]
+            masks = (lowest.astype(np.uint64) << np.arange(cache.set_size, dtype=np.uint64)).sum(axis=1)
+            np.frombuffer(cache.lfu_lowest, dtype=np.uint16)[full] = masks[full]
+
+    #writes the state held by the shard worker processes and the engine back to the Cache_Level objects and releases the views of their arrays
+    def finish(self):
+        for sharded in self.sharded.values():
+            sharded.finish()
+
+        for cache in self.set_state:
+            self.store_sets(cache)
+
+        self.direct_state = {}
+        self.set_state = {}
+
+
+#yields the memory addresses in a text, binary or compressed trace file as arrays, a chunk at a time
+def read_chunks(trace_file):
+    if Trace_File.is_compressed_trace(trace_file):   #decompressed and decoded in background threads
+        with Trace_Pipeline.TracePipeline(trace_file, as_arrays=True) as pipeline:
+            yield from pipeline.chunks()
+        return
+
+    if Trace_File.is_binary_trace(trace_file):
+        with Trace_File.TraceReader(trace_file) as reader:
+            if reader.flags & Trace_File.COMPACTED:   #repeats the address of each run for every access in it
+                yield from (np.repeat(records["address"], records["size"]) for records in reader.chunks(BINARY_CHUNK_SIZE))
+            else:
+                yield from (records["address"] for records in reader.chunks(BINARY_CHUNK_SIZE))   #zero-copy views of the records
+        return
+
+    with open(trace_file, 'rb') as file:
+        for lines in Trace_File.line_blocks(iter(lambda: file.read(CHUNK_SIZE), b"")):
+            yield from Trace_File.decode_text_block(lines)
+
+
+#returns the order that groups the accesses by their index (a set, cache line or shard below index_num), keeping them in trace order within each group
+def group_order(index, index_num):
+    if index_num <= 1 << 16:
+        index = index.astype(np.uint16)   #NumPy sorts 16-bit keys with a radix sort, which is several times quicker
+    return np.argsort(index, kind="stable")
+
+
+#collapses each run of consecutive accesses to the same cache line (given by the offset bits) into its first address, returning those and the number of accesses in each run
+def compact_chunk(addresses, offset_bits):
+    if addresses.size == 0:
+        return addresses, np.zeros(0, dtype=np.int64)
+
+    lines = addresses >> np.uint64(offset_bits)
+    starts = np.flatnonzero(np.concatenate(([True], lines[1:] != lines[:-1])))   #first access of each run
+    return addresses[starts], np.diff(np.append(starts, addresses.size))
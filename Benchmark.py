@@ -0,0 +1,136 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import Trace_File
+import Trace_Generator
+
+'''
+This file contains the benchmark suite for the simulator.
+
+Every cache kind is run with every replacement policy on synthetic traces of each access pattern. Each case runs in a fresh process so
+its peak memory use (RSS) can be measured on its own, and the accesses/sec, wall time and peak RSS of every case are written as JSON.
+The results can be compared against a saved baseline to show speedups and regressions.
+'''
+
+KINDS = ["direct", "full", "2way", "4way", "8way"]   #cache kinds benchmarked
+POLICIES = ["rr", "lru", "lfu"]   #replacement policies benchmarked (direct mapped caches have none)
+REGRESSION_TOLERANCE = 0.1   #fraction of the baseline throughput a case can lose before it is reported as a regression
+
+
+#returns the peak resident set size of the current process in kilobytes
+def peak_rss_kb():
+    try:
+        with open("/proc/self/status", 'r') as file:   #VmHWM starts afresh in a new program, unlike ru_maxrss, which a spawned process inherits from the one that forked it
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss   #without /proc the process's own maximum is the closest measure
+    return peak // 1024 if sys.platform == "darwin" else peak   #bytes on macOS, kilobytes elsewhere
+
+#runs one case in the current (fresh) process and returns its measurements
+def run_case(config_file, trace_file, engine):
+    import Cache_Simulator   #imported here so the import isn't part of the parent process's memory use
+
+    Cache_Simulator.reset_simulator()
+    Cache_Simulator.set_up_cache(Cache_Simulator.read_config(config_file))
+
+    start = time.perf_counter()
+    if engine == "numpy":
+        Cache_Simulator.trace_program_batch(trace_file)
+    else:
+        Cache_Simulator.trace_program(trace_file)
+    wall_time = time.perf_counter() - start
+
+    accesses = Cache_Simulator.cache_hierarchy[0].hits + Cache_Simulator.cache_hierarchy[0].misses
+    return {
+        "accesses": accesses,
+        "wall_time": wall_time,
+        "accesses_per_sec": accesses / wall_time if wall_time else 0.0,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+#runs a case in its own fresh process
+def run_isolated(config_file, trace_file, engine):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_case, config_file, trace_file, engine).result()
+
+#compares the results with a baseline, adding the speedup of each case and returning the names of the regressions
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, case in results['cases'].items():
+        previous = baseline.get('cases', {}).get(name)
+        if previous is None or not previous['accesses_per_sec']:
+            continue
+
+        case['baseline_accesses_per_sec'] = previous['accesses_per_sec']
+        case['speedup'] = case['accesses_per_sec'] / previous['accesses_per_sec']
+        if case['speedup'] < 1 - tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark every cache kind and replacement policy on synthetic traces")
+    parser.add_argument("--length", type=int, default=200000, help="number of accesses in each trace (default: 200000)")
+    parser.add_argument("--patterns", nargs="+", choices=Trace_Generator.PATTERNS, default=Trace_Generator.PATTERNS, help="access patterns to generate (default: all)")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=KINDS, help="cache kinds to run (default: all)")
+    parser.add_argument("--policies", nargs="+", choices=POLICIES, default=POLICIES, help="replacement policies to run (default: all)")
+    parser.add_argument("--size", type=int, default=32768, help="cache size in bytes (default: 32768)")
+    parser.add_argument("--line-size", type=int, default=64, help="cache line size in bytes (default: 64)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the traces (default: 0)")
+    parser.add_argument("--engine", choices=["line", "numpy"], default="line", help="simulation engine (default: line)")
+    parser.add_argument("--binary", action="store_true", help="convert the traces to the binary trace format first")
+    parser.add_argument("--output", default="benchmark_output.json", help="file the results are written to (default: benchmark_output.json)")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="throughput loss reported as a regression (default: 0.1)")
+    args = parser.parse_args()
+
+    results = {"settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}, "cases": {}}
+
+    with tempfile.TemporaryDirectory() as directory:
+        for pattern in args.patterns:
+            trace_file = os.path.join(directory, f"{pattern}.txt")
+            Trace_Generator.write_trace(trace_file, pattern, args.length, seed=args.seed)
+            if args.binary:
+                binary_file = os.path.join(directory, f"{pattern}.bin")
+                Trace_File.convert_trace(trace_file, binary_file)
+                trace_file = binary_file
+
+            for kind in args.kinds:
+                for policy in ([""] if kind == "direct" else args.policies):
+                    name = f"{pattern}/{kind}" + (f"/{policy}" if policy else "")
+                    config_file = os.path.join(directory, "config.json")
+                    with open(config_file, 'w') as file:
+                        json.dump({"caches": [{"name": "L1", "size": args.size, "line_size": args.line_size, "kind": kind, "replacement_policy": policy}]}, file)
+
+                    case = run_isolated(config_file, trace_file, args.engine)
+                    results['cases'][name] = case
+                    print(f"{name}: {case['accesses_per_sec']:.0f} accesses/sec, {case['wall_time']:.3f} s, {case['peak_rss_kb']} KB peak RSS")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+
+        for name, case in results['cases'].items():
+            if 'speedup' in case:
+                print(f"{name}: {case['speedup']:.2f}x the baseline" + (" (regression)" if name in regressions else ""))
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=4)
+
+    if regressions:
+        print(f"{len(regressions)} regressions beyond {args.tolerance:.0%}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
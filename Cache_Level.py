@@ -1,16 +1,32 @@
 import math
+from array import array
+from heapq import heapify, heappop, heappush
 
 '''
 This file contains the CacheLevel Class which represnts each cache level in the hierarchy
+
+The cache store is a flat array of tags (or, for set-associative levels, cache line numbers: the tag and index bits together) indexed by
+set * ways + way, and the replacement state is kept in flat arrays alongside it (the order of use of each set as a linked list of its
+ways, least frequently used counts or round robin counters), so a set-associative level costs about 8 bytes per cache line (10 with lru,
+16 with lfu) and is created almost instantly however large it is. An access searches the valid cache lines of its set, at most 16 of
+them. Fully-associative levels keep a dictionary from each tag stored to its way instead, as their one set is too large to search.
 '''
 
 ADDRESS_SIZE = 64   #size (in bits) of the memory address in the trace file
 TWO_WAY = 2   #number of cache lines in 2-way set-associative cache
 FOUR_WAY = 4   #number of cache lines in 4-way set-associative cache
 EIGHT_WAY = 8   #number of cache lines in 8-way set-associative cache
+SIXTEEN_WAY = 16   #number of cache lines in 16-way set-associative cache
+
+SET_ASSOCIATIVE_WAYS = {"2way": TWO_WAY, "4way": FOUR_WAY, "8way": EIGHT_WAY, "16way": SIXTEEN_WAY}   #number of cache lines in each set for every set-associative cache kind
 
 class CacheLevel:
-    def __init__(self, name, size, line_size, kind, replacement_policy):
+    __slots__ = ("name", "line_size", "line_num", "size", "kind", "hits", "misses", "per_set_rr", "replacement_policy",   #configuration and counters
+                 "set_size", "set_num", "cache", "valid", "set_fill", "tag_index",   #cache store
+                 "meta_data_cache", "lru_prev", "lru_next", "lru_head", "lru_tail", "lfu_lowest", "lfu_buckets", "lfu_sizes", "lfu_min", "rr_counter",   #replacement state
+                 "index_bits", "offset_bits", "tag_bits", "tag_shift", "index_mask", "tag", "index", "line")   #address partitioning
+
+    def __init__(self, name, size, line_size, kind, replacement_policy, per_set_rr=False):
         self.name = name   #cache name
         self.line_size = line_size   #cache line size
         self.line_num = size // line_size   #number of cache lines
@@ -18,181 +34,334 @@ class CacheLevel:
         self.kind = kind   #cache kind
         self.hits = 0   #number of hits
         self.misses = 0   #number of misses
-    
+        self.per_set_rr = per_set_rr   #whether round robin keeps a counter for each set (instead of the original single counter shared by every set)
+
         self.set_replacement_policy(replacement_policy)   #sets the replacement policy
         self.initialise_cache()   #creates the cache store
         self.set_partition_bits()   #calculates the parition bits for the memory address
 
-    #sets up an array representing the cache store based on the cache kind
+    #sets up a flat array representing the cache store based on the cache kind
     def initialise_cache(self):
         if self.kind == "direct":
-            self.cache = [None] * self.line_num   #1D array for the cache store
+            self.set_size = 1   #each cache line is its own set
+            self.set_num = self.line_num   #number of sets
+            self.cache = array('Q', [0]) * self.line_num   #flat array of the tag in each cache line
+            self.valid = bytearray(self.line_num)   #valid bit of each cache line
         elif self.kind == "full":
-            self.cache = [None] * self.line_num   #1D array for the cache store
-            self.initialise_meta_data_cache(self.line_num)   #sets up the meta data array
-        elif self.kind == "2way":
-            self.set_size = TWO_WAY   #number of cache lines in each set
-            self.set_num = self.line_num // TWO_WAY   #number of sets
-            self.cache = [[None for j in range(TWO_WAY)] for i in range(self.set_num)]   #2D array for the cache store
-            self.initialise_meta_data_cache(TWO_WAY)   #sets up the meta data array
-        elif self.kind == "4way": 
-            self.set_size = FOUR_WAY   #number of cache lines in each set
-            self.set_num = self.line_num // FOUR_WAY   #number of sets
-            self.cache = [[None for j in range(FOUR_WAY)] for i in range(self.set_num)]   #2D array for the cache store
-            self.initialise_meta_data_cache(FOUR_WAY)   #sets up the meta data array
-        elif self.kind == "8way":
-            self.set_size = EIGHT_WAY   #number of cache lines in each set
-            self.set_num = self.line_num // EIGHT_WAY   #number of sets
-            self.cache = [[None for j in range(EIGHT_WAY)] for i in range(self.set_num)]   #2D array for the cache store
-            self.initialise_meta_data_cache(EIGHT_WAY)   #sets up the meta data array
+            self.set_size = self.line_num   #a fully-associative cache is treated as a single set containing every cache line
+            self.set_num = 1   #number of sets
+            self.cache = array('Q', [0]) * self.line_num   #flat array of the tag in each cache line
+            self.tag_index = {}   #maps each tag stored to the cache line (way) holding it; for lru the order of the keys is also the order of use (least recently used first)
+            self.initialise_meta_data_cache()   #sets up the meta data array
+        elif self.kind in SET_ASSOCIATIVE_WAYS:
+            self.set_size = SET_ASSOCIATIVE_WAYS[self.kind]   #number of cache lines in each set
+            self.set_num = self.line_num // self.set_size   #number of sets
+            self.cache = array('Q', [0]) * (self.set_num * self.set_size)   #flat array of the cache line number (tag and index bits together) in each cache line (set * ways + way)
+            self.set_fill = array('H', [0]) * self.set_num   #number of valid cache lines in each set (they are filled in order, so these are the valid bits)
+            self.initialise_meta_data_cache()   #sets up the meta data array
         else:
             print("Invalid cache kind")
-    
-    #creates a seperate array to store the meta data (used to implement the replacement policy)
-    def initialise_meta_data_cache(self, way_num):
-        if self.replacement_policy == "lru" or self.replacement_policy == "lfu":   #checks whether the replacement policy is round robin or not
-            if self.kind == "full":   #checks whether the cahce kind is fully-associative or not
-                self.meta_data_cache = [0] * self.line_num   #1D array for the meta data if fully-associative
+
+    #creates the seperate structures used to implement the replacement policy
+    def initialise_meta_data_cache(self):
+        if self.replacement_policy == "lfu":   #checks whether the replacement policy is least frequently used or not
+            self.meta_data_cache = array('Q', [0]) * len(self.cache)   #flat array counting the number of times each cache line has been accessed
+            if self.kind == "full":   #a fully-associative set is too large to search for the lowest count on every replacement
+                self.lfu_buckets = None   #maps an access count to a heap of the cache lines with that count (built when the cache first fills up)
+                self.lfu_sizes = None   #maps an access count to the number of cache lines that currently have it
+                self.lfu_min = 0   #the lowest access count of any cache line
             else:
-                self.meta_data_cache = [[0 for j in range(way_num)] for i in range(self.set_num)]   #2D array for the meta data if set-associative
-        else:
-            self.meta_data_cache = None   #no meta data array needed if the replacement polciy is round robin
-        
-        #checks which cache kind to initialise the appropriate counter variable
-        if self.replacement_policy == "lfu":
-            self.lfu_counter = 0   #counter variable for least frequently used (count for each cache line indcating the number of times it has been accessed)
-        elif self.replacement_policy == "lru": 
-            self.lru_counter = 0   #counter variable for least recently used (maintains the order of access of each cache line to identify the one that hasn't been used the recently)
+                self.lfu_lowest = array('H', [0]) * self.set_num   #bitmask of the ways with the lowest access count in each full set (0 until the set fills up)
         else:
-            self.rr_counter = 0   #counter variable for round robin (indicates the current cache line to replace)
-    
+            self.meta_data_cache = None   #no meta data array needed as the order of use is kept by the linked lists or tag index (lru) or the counter (round robin)
+
+        if self.replacement_policy == "lru" and self.kind != "full":   #the order of use of each set is a linked list of its ways (least recently used first)
+            self.lru_prev = array('B', [0]) * len(self.cache)   #way used just before each cache line
+            self.lru_next = array('B', [0]) * len(self.cache)   #way used just after each cache line
+            self.lru_head = array('B', [0]) * self.set_num   #least recently used way of each set
+            self.lru_tail = array('B', [0]) * self.set_num   #most recently used way of each set
+
+        if self.replacement_policy == "rr":
+            if self.per_set_rr:
+                self.rr_counter = array('L', [0]) * self.set_num   #counter variable for round robin in each set (indicates the current cache line to replace)
+            else:
+                self.rr_counter = 0   #counter variable for round robin (indicates the current cache line to replace)
+
     #sets the replacement policy based on the cache kind
     def set_replacement_policy(self, replacement_policy):
         if self.kind == "direct":   #checks if the cache kind is direct or not
             self.replacement_policy = ""   #if direct then replacement policy is needed
-        elif self.kind == "full" or self.kind == "2way" or self.kind == "4way" or self.kind == "8way":
+        elif self.kind == "full" or self.kind in SET_ASSOCIATIVE_WAYS:
             if replacement_policy != "rr" and replacement_policy != "lru" and replacement_policy != "lfu": #checks if the appropriate replacement policy has been specified
                 self.replacement_policy = "rr"   #if not then round robin is the default policy used
             else:
                 self.replacement_policy = replacement_policy   #otherwise the specified one is used
         else:
             print("Invalid cache kind")
-    
+
     #calculates the number of bits for the tag, index and offset based on the memory address
     def set_partition_bits(self):
         if self.kind == "direct":   #checks if cache kind is direct
             self.index_bits = int(math.log2(self.line_num))   #if so index bits is calculated using the number of cache lines
-        elif self.kind == "2way" or self.kind == "4way" or self.kind == "8way":   #checks if cache kind is set-associative
+        elif self.kind in SET_ASSOCIATIVE_WAYS:   #checks if cache kind is set-associative
             self.index_bits = int(math.log2(self.set_num))   #if so index bits is calculates using the number of sets
         else:
             self.index_bits = 0   #if fully-associative then no index bits is needed
 
         self.offset_bits = int(math.log2(self.line_size))   #calculates the number of offset bits based on the cache line size
-        self.tag_bits  = ADDRESS_SIZE - (self.index_bits + self.offset_bits)   #calculates the number of tag bits 
-    
-    #splits the memory address into tag, index and offset
+        self.tag_bits  = ADDRESS_SIZE - (self.index_bits + self.offset_bits)   #calculates the number of tag bits
+
+        self.tag_shift = self.index_bits + self.offset_bits   #shift that moves the tag bits down to bit 0
+        self.index_mask = (1 << self.index_bits) - 1   #mask that keeps the index bits once the offset bits have been shifted out
+
+    #splits the memory address (as an int) into tag and index using the precomputed shifts and masks
     def partition_address(self, address):
-        hex_to_int = int(address, 16)   #converts hex to int
-        binary_string = bin(hex_to_int)   #converts int to binary
-        binary_string = binary_string[2:]
-        binary_string = binary_string.zfill(ADDRESS_SIZE)   #recovers leading 0 bits lost during conversion
-
-        self.tag = binary_string[:self.tag_bits]   #extrats the tag bits from the binary memory address
-        self.index = binary_string[self.tag_bits:ADDRESS_SIZE - self.offset_bits]   #extrats the index bits from the binary memory address
-        self.offset = binary_string[-self.offset_bits:]   #extrats the offset bits from the binary memory address
-    
+        self.tag = address >> self.tag_shift   #extracts the tag bits from the memory address
+        self.index = (address >> self.offset_bits) & self.index_mask   #extracts the index bits from the memory address
+
     #calls the relevant function to perform the cache access based on the cache kind
     def search_cache(self, address):
         if self.kind == "direct":   #if direct
             return self.search_direct(address)
         elif self.kind == "full":   #if fully-associative
             return self.search_fully_ass(address)
-        elif self.kind == "2way":   #if set-associative
-            return self.search_set_ass(TWO_WAY, address)
-        elif self.kind == "4way":   #if set-associative
-            return self.search_set_ass(FOUR_WAY, address)
-        elif self.kind == "8way":   #if set-associative
-            return self.search_set_ass(EIGHT_WAY, address)
-
+        elif self.kind in SET_ASSOCIATIVE_WAYS:   #if set-associative
+            return self.search_set_ass(address)
         else:
             print("Invalid cache kind")
-    
+
     #checks the cache lines in direct mapped cache
     def search_direct(self, address):
         self.partition_address(address)   #paritions the memory address
-        index_int = int(self.index, 2)   #converts the index bits to identify the relvant cache line 
+        index_int = self.index   #index of the relevant cache line
 
-        if self.tag == self.cache[index_int]:   #checks if the cache line contains the tag bits
+        if self.valid[index_int] and self.tag == self.cache[index_int]:   #checks if the cache line contains the tag bits
             self.hits += 1   #increments the hit counter on a hit
             return True
         else:
             self.cache[index_int] = self.tag   #stores the tag in the cache line
+            self.valid[index_int] = 1
             self.misses += 1   #increments the miss counter on a miss
             return False
-    
+
     #checks the cache lines in fully associative cache
     def search_fully_ass(self, address):
-        self.partition_address(address)   #paritions the memory address
+        self.line = address >> self.offset_bits    #paritions the memory address (the cache line number is the tag as there are no index bits)
+        way = self.tag_index.get(self.line)   #looks up the cache line holding the tag bits (if any)
+
+        if way is not None:
+            self.hits += 1   #hit counter incremented on a hit
+
+            if self.replacement_policy != "rr":   #checks if the replacement policy isn't round robin
+                self.update_meta_data(0, way)    #if not then updates the meta data based on the current cache access
+
+            return True
 
-        for i in range(self.line_num):   #goes through each cache line
-            if self.tag == self.cache[i]:   #checks if current cache line contains the tag bits
-                self.hits += 1   #hit counter incremented on a hit 
-
-                if self.replacement_policy != "rr":   #checks if the replacement policy isn't round robin
-                    self.update_meta_data(0, i, True)   #if not then updates the meta data based on the current cache access
-                    
-                return True
-            elif self.cache[i] == None:   #checks if current cache line is empty 
-                self.cache[i] = self.tag   #if so stores the tag bits in that cache line
-                self.misses += 1   #increments miss counter on a miss
-                
-                if self.replacement_policy != "rr":   #checks if the replacement policy isn't round robin
-                    self.update_meta_data(0, i, True)   #if not then updates the meta data based on the current cache access
-                    
-                return False
-            
-        self.replace_cacheline(0)   #if the entire cache is traversed and the tag bits weren't found and all the cache lines are occupied then a replacement needs to happen
+        self.insert_tag(0)   #stores the tag bits on a miss
         return False
-    
+
     #checks the cache lines in set-associative cache
-    def search_set_ass(self, set_size, address):
-        self.partition_address(address)    #paritions the memory address
-        index_int = int(self.index, 2)   #converts the index bits to int to identify the relevant set
-
-        for i in range(set_size):   #goes through the set
-            if self.tag == self.cache[index_int][i]:   #checks if current cache line contains the tag bits
-                self.hits += 1   #hit counter incremented on a hit 
-                
-                if self.replacement_policy != "rr":   #checks if the replacement policy isn't round robin
-                    self.update_meta_data(index_int, i, False)    #if not then updates the meta data based on the current cache access
-                    
-                return True
-            elif self.cache[index_int][i] == None:   #checks if current cache line is empty 
-                self.cache[index_int][i] = self.tag   #if so stores the tag bits in that cache line
-                self.misses += 1   #increments miss counter on a miss
-
-                if self.replacement_policy != "rr":   #checks if the replacement policy isn't round robin
-                    self.update_meta_data(index_int, i, False)    #if not then updates the meta data based on the current cache access
-                    
-                return False
-            
-        self.replace_cacheline(index_int)   #if the entire cache is traversed and the tag bits weren't found and all the cache lines are occupied then a replacement needs to happen
-        return False
-    
-    #updates the meta data based on the cache access for fully-associative cache and set-associative cache
-    def update_meta_data(self, index1, index2 , isFull):
-        if isFull:   #checks if cache kind is fully-associative or not
-            if self.replacement_policy == "lfu":   #if replacement policy is least frequently used
-                self.meta_data_cache[index2] += 1   #increments the specified index in the meta data array corresponding to the accessed cache line in the cache array
-            elif self.replacement_policy == "lru":   #if replacement policy is least recently used
-                self.meta_data_cache[index2] = self.lru_counter   #assigns the current order count to the index specified
-                self.lru_counter += 1   #increments the counter
+    def search_set_ass(self, address):
+        line = address >> self.offset_bits   #the tag and index bits of the memory address together
+        index_int = line & self.index_mask
+        start = index_int * self.set_size
+        try:
+            way = self.cache.index(line, start, start + self.set_fill[index_int]) - start   #searches the valid cache lines of the set for the tag bits
+        except ValueError:
+            self.line = line
+            self.insert_tag(index_int)   #stores the tag bits on a miss
+            return False
+
+        self.hits += 1   #hit counter incremented on a hit
+
+        if self.replacement_policy != "rr":   #checks if the replacement policy isn't round robin
+            self.update_meta_data(index_int, way)    #if not then updates the meta data based on the current cache access
+
+        return True
+
+    #returns the way of the given set holding the cache line number, or None if the set doesn't hold it
+    def find_way(self, line, index_int):
+        start = index_int * self.set_size
+        try:
+            return self.cache.index(line, start, start + self.set_fill[index_int]) - start   #only the valid cache lines are searched
+        except ValueError:
+            return None
+
+    #stores the tag bits in the given set after a miss, using an empty cache line if there is one or replacing one otherwise
+    def insert_tag(self, index_int):
+        if self.kind == "full":
+            way = len(self.tag_index)   #the cache lines are filled in order
+        else:
+            way = self.set_fill[index_int]
+
+        if way < self.set_size:   #checks if the set still has an empty cache line
+            self.cache[index_int * self.set_size + way] = self.line   #if so stores the tag bits in that cache line
+            if self.kind == "full":
+                self.tag_index[self.line] = way
+            else:
+                self.set_fill[index_int] = way + 1
+            self.misses += 1   #increments miss counter on a miss
+
+            if self.replacement_policy == "lfu":   #checks if the replacement policy is least frequently used
+                self.update_meta_data(index_int, way)    #if so then updates the meta data based on the current cache access
+
+                if way == self.set_size - 1 and self.kind == "full":   #builds the frequency buckets once the cache has filled up
+                    self.initialise_lfu_buckets()
+            elif self.replacement_policy == "lru" and self.kind != "full" and way:   #appends the cache line to the order of use of the set
+                tail = self.lru_tail[index_int]
+                self.lru_next[index_int * self.set_size + tail] = way
+                self.lru_prev[index_int * self.set_size + way] = tail
+                self.lru_tail[index_int] = way
+        else:
+            self.replace_cacheline(index_int)   #if all the cache lines are occupied then a replacement needs to happen
+
+    #checks a stream of accesses (given as cache line numbers, the tag and set index together) against the fully or set-associative cache, returning whether each one was a hit
+    #(if the number of accesses in the run of each one is given, least frequently used counts them all, though only the first is a hit or miss here)
+    def search_stream(self, lines, repeats=None):
+        results = []
+        append = results.append
+        cache = self.cache
+        hits = 0
+
+        if self.kind == "full" and self.replacement_policy == "lru":   #least recently used only needs the tag index, so the whole access is done here
+            tag_index = self.tag_index
+            set_size = self.set_size
+            for tag in lines:
+                way = tag_index.pop(tag, None)
+                if way is not None:   #on a hit the tag is put back at the end of the order of use
+                    tag_index[tag] = way
+                    hits += 1
+                    append(True)
+                else:
+                    if len(tag_index) < set_size:
+                        way = len(tag_index)   #fills the next empty cache line
+                    else:
+                        way = tag_index.pop(next(iter(tag_index)))   #replaces the least recently used cache line
+                    tag_index[tag] = way
+                    cache[way] = tag
+                    append(False)
+            self.misses += len(results) - hits
+
         else:
-            if self.replacement_policy == "lfu":   #if replacement policy is least frequently used
-                self.meta_data_cache[index1][index2] += 1   #increments the index in the meta data array corresponding to the accessed cache line in the cache array
-            elif self.replacement_policy == "lru":   #if replacement policy is least recently used
-                self.meta_data_cache[index1][index2] = self.lru_counter   #assigns the current order count to the index specified
-                self.lru_counter += 1   #increments the counter
+            tag_index = self.tag_index if self.kind == "full" else None
+            set_fill = self.set_fill if self.kind != "full" else None
+            set_size = self.set_size
+            index_mask = self.index_mask
+            update = self.update_meta_data if self.replacement_policy != "rr" else None   #round robin keeps nothing on a hit
+            for position, line in enumerate(lines):
+                index_int = line & index_mask
+                if tag_index is not None:
+                    way = tag_index.get(line)
+                else:   #searches the valid cache lines of the set
+                    start = index_int * set_size
+                    try:
+                        way = cache.index(line, start, start + set_fill[index_int]) - start
+                    except ValueError:
+                        way = None
+
+                if way is not None:
+                    hits += 1
+                    if update is not None:
+                        update(index_int, way, 1 if repeats is None else repeats[position])
+                    append(True)
+                else:
+                    self.line = line
+                    self.insert_tag(index_int)   #counts the miss
+                    if repeats is not None and repeats[position] > 1 and update is not None:   #the rest of the run hits the cache line just stored
+                        update(index_int, tag_index[line] if tag_index is not None else self.find_way(line, index_int), repeats[position] - 1)
+                    append(False)
+
+        self.hits += hits
+        return results
+
+    #updates the meta data based on a cache access (or the given number of repeated accesses) to the given cache line (way) in the given set
+    def update_meta_data(self, index_int, way, repeats=1):
+        if self.replacement_policy == "lfu":   #if replacement policy is least frequently used
+            line = index_int * self.set_size + way
+            count = self.meta_data_cache[line]
+            new_count = count + repeats
+            self.meta_data_cache[line] = new_count   #increments the access count of the cache line
+
+            if self.kind != "full":
+                if self.set_fill[index_int] == self.set_size:   #the cache line no longer has the lowest count, finding the next lowest ways once none are left
+                    lowest = self.lfu_lowest[index_int] & ~(1 << way)
+                    self.lfu_lowest[index_int] = lowest if lowest else self.lowest_ways(index_int)
+                return
+
+            buckets = self.lfu_buckets
+            if buckets is not None:   #moves the cache line to the next frequency bucket if the cache is full
+                sizes = self.lfu_sizes
+                sizes[count] -= 1
+                if sizes[count] == 0:   #drops the bucket once no cache line has that count anymore
+                    del sizes[count]
+                    del buckets[count]
+                    if self.lfu_min == count:   #a single access moves the cache line to the next possible count, more may skip over other buckets
+                        self.lfu_min = new_count if repeats == 1 else min(min(buckets, default=new_count), new_count)
+
+                if new_count in buckets:
+                    heappush(buckets[new_count], way)
+                    sizes[new_count] += 1
+                else:
+                    buckets[new_count] = [way]
+                    sizes[new_count] = 1
+        elif self.replacement_policy == "lru":   #if replacement policy is least recently used
+            if self.kind == "full":
+                tag_index = self.tag_index
+                tag = self.cache[way]
+                del tag_index[tag]   #moves the tag to the end of the order of use
+                tag_index[tag] = way
+            else:   #moves the cache line to the end of the order of use of the set (the linked list of its ways)
+                tail = self.lru_tail[index_int]
+                if way == tail:
+                    return
+
+                start = index_int * self.set_size
+                lru_prev = self.lru_prev
+                lru_next = self.lru_next
+                following = lru_next[start + way]
+                if way == self.lru_head[index_int]:   #unlinks the cache line
+                    self.lru_head[index_int] = following
+                else:
+                    preceding = lru_prev[start + way]
+                    lru_next[start + preceding] = following
+                    lru_prev[start + following] = preceding
+
+                lru_next[start + tail] = way   #links it back in after the most recently used one
+                lru_prev[start + way] = tail
+                self.lru_tail[index_int] = way
+
+    #counts a run of further accesses to the cache line the memory address has just been accessed in, which are all hits (least frequently used also counts them for the cache line)
+    def repeat_hits(self, address, repeats):
+        self.hits += repeats
+
+        if self.replacement_policy == "lfu":   #the order of use (lru) and the round robin counter don't change on a hit
+            line = address >> self.offset_bits
+            index_int = line & self.index_mask
+            self.update_meta_data(index_int, self.tag_index[line] if self.kind == "full" else self.find_way(line, index_int), repeats)
+
+    #groups the cache lines of a full fully-associative cache into buckets by their access count
+    def initialise_lfu_buckets(self):
+        buckets = {}
+        for way, count in enumerate(self.meta_data_cache):
+            buckets.setdefault(count, []).append(way)
+
+        for heap in buckets.values():
+            heapify(heap)   #each bucket is a heap so the lowest cache line is replaced first when counts are tied
+
+        self.lfu_buckets = buckets
+        self.lfu_sizes = {count: len(heap) for count, heap in buckets.items()}
+        self.lfu_min = min(buckets)
+
+    #returns the bitmask of the ways with the lowest access count in a full set
+    def lowest_ways(self, index_int):
+        start = index_int * self.set_size
+        counts = self.meta_data_cache[start:start + self.set_size]
+        lowest = min(counts)
+        ways = 0
+        for way, count in enumerate(counts):
+            if count == lowest:
+                ways |= 1 << way
+        return ways
 
     #calls the relevant function based on the replacement policy
     def replace_cacheline(self, index_int):
@@ -200,56 +369,163 @@ class CacheLevel:
             self.round_robin(index_int)
         elif self.replacement_policy == "lru":   #if least recently used
             self.least_recently_used(index_int)
-        elif self.replacement_policy == "lfu":   #if least frequently used 
+        elif self.replacement_policy == "lfu":   #if least frequently used
             self.least_frequently_used(index_int)
         else:
             print("Invalid replacement policy")
-    
+
+    #stores the tag bits in the given cache line (way) in place of the tag it currently holds
+    def store_tag(self, index_int, way):
+        line = index_int * self.set_size + way
+        if self.kind == "full":
+            del self.tag_index[self.cache[line]]   #removes the replaced tag from the tag index
+            self.tag_index[self.line] = way
+        self.cache[line] = self.line   #stores the tag bits in the cache line
+
     #replaces a cache line based on the round robin replacement policy
     def round_robin(self, index_int):
         self.misses += 1   #increments the miss coutner on a miss
-        
-        if self.kind == "full":    #checks if cache kind is fully-associative or not
-            self.cache[self.rr_counter] = self.tag   #stores the tag bits in the index specified by the round robin counter
-            self.rr_counter += 1   #increments the round robin counter
 
-            if self.rr_counter == self.line_num:   #resets the counter to 0 if the value exceeds the number of cache lines
-                self.rr_counter = 0
-        else:
-            self.cache[index_int][self.rr_counter] = self.tag   #stores the tag bits in the index specified by the round robin counter
-            self.rr_counter += 1   #increments the round robin counter
+        if self.per_set_rr:   #the counter of the set is used
+            way = self.rr_counter[index_int]
+            self.store_tag(index_int, way)   #stores the tag bits in the index specified by the round robin counter
+            self.rr_counter[index_int] = way + 1 if way + 1 < self.set_size else 0   #increments the counter, resetting it to 0 at the end of the set
+            return
+
+        self.store_tag(index_int, self.rr_counter)   #stores the tag bits in the index specified by the round robin counter
+        self.rr_counter += 1   #increments the round robin counter
+
+        if self.rr_counter == self.set_size:   #resets the counter to 0 if the value exceeds the number of cache lines in each set
+            self.rr_counter = 0
 
-            if self.rr_counter == self.set_size:   #resets the counter to 0 if the value exceeds the number of cache lines in each set
-                self.rr_counter = 0
-    
     #replaces a cache line based on the least recently used replacement policy
     def least_recently_used(self, index_int):
         self.misses += 1   #increments the miss coutner on a miss
 
-        if self.kind == "full":    #checks if cache kind is fully-associative or not
-            min_index = self.meta_data_cache.index(min(self.meta_data_cache))   #gets the array index of the cache line with the lowest order value
-            self.cache[min_index] = self.tag   #stores the tag bits in the cache line specified by the index
-            self.meta_data_cache[min_index] = self.lru_counter   #updates the order value of the current cache line
-            self.lru_counter += 1   #increments the least recently used counter
-        else:
-            min_index = self.meta_data_cache[index_int].index(min(self.meta_data_cache[index_int]))   #gets the array index of the cache line with the lowest order value
-            self.cache[index_int][min_index] = self.tag   #stores the tag bits in the cache line specified by the index
-            self.meta_data_cache[index_int][min_index] = self.lru_counter   #updates the order value of the current cache line
-            self.lru_counter += 1   #increments the least recently used counter
-    
+        if self.kind == "full":
+            tag_index = self.tag_index
+            way = tag_index.pop(next(iter(tag_index)))   #the first tag in the tag index is the least recently used one
+            self.cache[way] = self.line   #stores the tag bits in the cache line
+            tag_index[self.line] = way   #the new tag becomes the most recently used one
+            return
+
+        start = index_int * self.set_size
+        lru_head = self.lru_head
+        lru_tail = self.lru_tail
+        lru_next = self.lru_next
+        way = lru_head[index_int]   #the head of the order of use is the least recently used cache line
+        self.store_tag(index_int, way)   #stores the tag bits in the cache line
+
+        tail = lru_tail[index_int]   #the new tag becomes the most recently used one, moving from the head to the tail
+        lru_head[index_int] = lru_next[start + way]
+        lru_next[start + tail] = way
+        self.lru_prev[start + way] = tail
+        lru_tail[index_int] = way
+
     #replaces a cache line based on the least frequently used replacement policy
     def least_frequently_used(self, index_int):
         self.misses += 1   #increments the miss coutner on a miss
-        
-        if self.kind == "full":    #checks if cache kind is fully-associative or not
-            min_index = self.meta_data_cache.index(min(self.meta_data_cache))   #gets the array index of the cache line with the lowest value
-            self.cache[min_index] = self.tag   #stores the tag bits in the cache line specified by the index
-            self.meta_data_cache[min_index] += 1   #increments the least frequently used counter
+
+        if self.kind == "full":
+            meta_data = self.meta_data_cache
+            lowest = self.lfu_min
+            heap = self.lfu_buckets[lowest]
+            way = heappop(heap)
+            while meta_data[way] != lowest:   #skips cache lines that have since moved to a higher bucket
+                way = heappop(heap)
+        else:
+            lowest = self.lfu_lowest[index_int]
+            way = (lowest & -lowest).bit_length() - 1   #the lowest cache line with the lowest count
+
+        self.store_tag(index_int, way)   #stores the tag bits in the cache line with the lowest count
+        self.update_meta_data(index_int, way)   #increments the least frequently used counter
+
+    #returns whether every cache line of the given set is valid (so a miss in it replaces one)
+    def is_set_full(self, index_int):
+        if self.kind == "direct":
+            return bool(self.valid[index_int])
+        elif self.kind == "full":
+            return len(self.tag_index) == self.set_size
+        return self.set_fill[index_int] == self.set_size
+
+    #returns whether the sets are independent of each other (so they can be simulated seperately), which isn't the case for the shared round robin counter
+    def has_independent_sets(self):
+        return self.replacement_policy != "rr" or self.per_set_rr
+
+    #copies the contents and replacement state of the given sets from another cache level with the same configuration
+    def merge_sets(self, other, set_ids):
+        if self.kind == "direct":
+            for index_int in set_ids:
+                self.cache[index_int] = other.cache[index_int]
+                self.valid[index_int] = other.valid[index_int]
+            return
+
+        for index_int in set_ids:
+            start = index_int * self.set_size
+            self.cache[start:start + self.set_size] = other.cache[start:start + self.set_size]
+            self.set_fill[index_int] = other.set_fill[index_int]
+
+            if self.replacement_policy == "lfu":
+                self.meta_data_cache[start:start + self.set_size] = other.meta_data_cache[start:start + self.set_size]
+                self.lfu_lowest[index_int] = other.lfu_lowest[index_int]
+            elif self.replacement_policy == "lru":
+                self.lru_prev[start:start + self.set_size] = other.lru_prev[start:start + self.set_size]
+                self.lru_next[start:start + self.set_size] = other.lru_next[start:start + self.set_size]
+                self.lru_head[index_int] = other.lru_head[index_int]
+                self.lru_tail[index_int] = other.lru_tail[index_int]
+            elif self.replacement_policy == "rr":
+                self.rr_counter[index_int] = other.rr_counter[index_int]
+
+    #returns the counters, contents and replacement state of the level (as ints and flat arrays), from which restore_state rebuilds it in a level with the same configuration
+    def get_state(self):
+        state = {"hits": self.hits, "misses": self.misses, "cache": self.cache}
+
+        if self.kind == "direct":
+            state["valid"] = self.valid
+            return state
+        elif self.kind == "full":
+            state["ways"] = array('L', self.tag_index.values())   #the cache lines filled so far, in order of use for lru
         else:
-            min_index = self.meta_data_cache[index_int].index(min(self.meta_data_cache[index_int]))   #gets the array index of the cache line with the lowest value
-            self.cache[index_int][min_index] = self.tag   #stores the tag bits in the cache line specified by the index
-            self.meta_data_cache[index_int][min_index] += 1   #increments the least frequently used counter
-    
+            state["set_fill"] = self.set_fill
+
+        if self.replacement_policy == "lfu":
+            state["meta_data_cache"] = self.meta_data_cache
+            if self.kind != "full":
+                state["lfu_lowest"] = self.lfu_lowest
+        elif self.replacement_policy == "lru" and self.kind != "full":
+            for name in ("lru_prev", "lru_next", "lru_head", "lru_tail"):
+                state[name] = getattr(self, name)
+        elif self.replacement_policy == "rr":
+            state["rr_counter"] = self.rr_counter   #an int, or an array with per_set_rr
+
+        return state
+
+    #restores the counters, contents and replacement state returned by get_state (in a level created with the same configuration)
+    def restore_state(self, state):
+        self.hits = state["hits"]
+        self.misses = state["misses"]
+        self.cache = state["cache"]
+
+        if self.kind == "direct":
+            self.valid = state["valid"]
+            return
+        elif self.kind == "full":
+            self.tag_index = {self.cache[way]: way for way in state["ways"]}
+        else:
+            self.set_fill = state["set_fill"]
+
+        if self.replacement_policy == "lfu":
+            self.meta_data_cache = state["meta_data_cache"]
+            if self.kind != "full":
+                self.lfu_lowest = state["lfu_lowest"]
+            elif len(self.tag_index) == self.set_size:   #the frequency buckets only exist once the cache has filled up
+                self.initialise_lfu_buckets()
+        elif self.replacement_policy == "lru" and self.kind != "full":
+            for name in ("lru_prev", "lru_next", "lru_head", "lru_tail"):
+                setattr(self, name, state[name])
+        elif self.replacement_policy == "rr":
+            self.rr_counter = state["rr_counter"]
+
     #helper function to print the cache configuration
     def print_config(self):
-        print(f"Cache: {self.name}, Line Size: {self.line_size}, Number of lines: {self.line_num}, Size: {self.size}, Kind: {self.kind}")
\ No newline at end of file
+        print(f"Cache: {self.name}, Line Size: {self.line_size}, Number of lines: {self.line_num}, Size: {self.size}, Kind: {self.kind}")
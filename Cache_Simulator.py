@@ -1,5 +1,11 @@
-import sys
+import argparse
 import json
+import os
+import sys
+import Checkpoint
+import Instrumentation
+import Stack_Distance
+import Trace_File
 from Cache_Level import CacheLevel
 
 '''
@@ -11,22 +17,309 @@ the cache line size, it doesn't result in multiple access of the same memory add
 
 cache_hierarchy = []   #list representing the cache hierarchy (stores each cache level as a Cache_Level object)
 mem_access = 0   #count for the number of times main memory has been accessed
+level_shards = {}   #number of worker processes each cache level is split across by the NumPy batch engine (if more than one)
+instrumentation = None   #Instrumentation object measuring the run (if any was asked for)
 
 def main():
-    if len(sys.argv) != 3: 
-        print("Usage: python Cache_Simulator.py <configuration file> <trace file>")
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:   #checks whether a subcommand (instead of a configuration file) has been given
+        SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
         return
 
-    config_file = sys.argv[1]
-    trace_file = sys.argv[2]
+    parser = argparse.ArgumentParser(usage="python Cache_Simulator.py <configuration file> <trace file> [options]")
+    parser.add_argument("config_file")
+    parser.add_argument("trace_file")
+    parser.add_argument("--engine", choices=["line", "numpy"], default="line", help="simulate one line at a time (default) or a chunk at a time with NumPy")
+    parser.add_argument("--compact", action="store_true", help="collapse runs of accesses to the same line of the first cache level as the trace file is read")
+    add_sampling_arguments(parser)
+    add_instrumentation_arguments(parser)
+    add_checkpoint_arguments(parser)
+    args = parser.parse_args()
     
-    cache_config = read_config(config_file)   #reads the congifuration
+    cache_config = read_config(args.config_file)   #reads the congifuration
+    if not cache_config:
+        return
     set_up_cache(cache_config)   #sets up the cache structure using the configuration
-    trace_program(trace_file)   #reads the trace file
+
+    line_size = Trace_File.compaction_line_size(args.trace_file)   #line size a compacted trace file was compacted with (0 if it isn't compacted)
+    if line_size and cache_hierarchy and cache_hierarchy[0].line_size < line_size:
+        print(f"The trace file was compacted with {line_size} byte lines, which is larger than the {cache_hierarchy[0].line_size} byte lines of the first cache level")
+        return
+
+    if args.sample_sets or args.sample_period:   #estimates the result from part of the trace instead
+        output_JSON = run_sampled(args)
+        if output_JSON is not None:
+            with open("output.json", 'w') as file:
+                json.dump(output_JSON, file, indent=4)
+        return
+
+    if args.checkpoint or args.resume:   #saves (or continues from) snapshots of the simulation
+        if args.engine == "numpy":
+            print("Checkpoints are taken by the per-line simulation, so it is used instead of --engine numpy")
+        if args.interval or args.progress or args.conflicts:
+            print("Checkpoints don't include the instrumentation, so it isn't used with --checkpoint or --resume")
+        if args.compact:
+            print("Checkpoints count their position in accesses, so --compact isn't used with --checkpoint or --resume")
+        if not trace_program_checkpointed(args, cache_config):
+            return
+    elif args.interval or args.progress or args.conflicts:   #measures the run as it goes
+        if args.engine == "numpy":
+            print("Instrumentation hooks into the per-line simulation, so it is used instead of --engine numpy")
+        if args.compact:
+            print("Instrumentation measures every access, so --compact isn't used with it")
+        trace_program_instrumented(args)
+    elif args.engine == "numpy" and Trace_File.numpy_available():
+        trace_program_batch(args.trace_file, args.compact)   #reads and simulates the trace file a chunk at a time
+    else:
+        if args.engine == "numpy":
+            print("NumPy is not installed, falling back to the per-line simulation")
+        if level_shards:
+            print("Sharded cache levels need --engine numpy, so they are simulated in this process")
+        if args.compact:
+            trace_program_compacted(args.trace_file)   #reads the trace file, collapsing runs of accesses to the same cache line
+        else:
+            trace_program(args.trace_file)   #reads the trace file
     output_stats("output.json")   ##outputs the result
+
+#adds the options for estimating the result from part of the trace
+def add_sampling_arguments(parser):
+    sampling = parser.add_mutually_exclusive_group()
+    sampling.add_argument("--sample-sets", type=int, metavar="RATE", help="only simulate 1 in every RATE sets (a power of 2) and scale the counters up")
+    sampling.add_argument("--sample-period", type=int, metavar="PERIOD", help="only simulate a window at the end of every PERIOD accesses and scale the counters up")
+    parser.add_argument("--sample-window", type=int, default=10000, metavar="WINDOW", help="number of accesses counted in each period (default: 10000)")
+    parser.add_argument("--sample-warm-up", type=int, default=10000, metavar="WARM_UP", help="number of accesses simulated but not counted before each window (default: 10000)")
+
+#adds the options for measuring the run as it goes
+def add_instrumentation_arguments(parser):
+    parser.add_argument("--interval", type=int, default=0, metavar="N", help="write the hits, misses and evictions of each level for every N accesses")
+    parser.add_argument("--interval-output", default="interval_output.jsonl", metavar="FILE", help="file the intervals are written to, as CSV if it ends in .csv (default: interval_output.jsonl)")
+    parser.add_argument("--progress", type=float, default=0, metavar="SECONDS", help="report the accesses/sec and ETA on stderr every SECONDS seconds")
+    parser.add_argument("--conflicts", action="store_true", help="count the conflict misses in each set of each level (added to output.json)")
+
+#adds the options for saving and resuming from checkpoints
+def add_checkpoint_arguments(parser):
+    parser.add_argument("--checkpoint", metavar="FILE", help="save a snapshot of the simulation to FILE periodically and at the end of the trace")
+    parser.add_argument("--checkpoint-every", type=int, default=1000000, metavar="N", help="number of accesses between checkpoints (default: 1000000)")
+    parser.add_argument("--resume", metavar="FILE", help="continue from the snapshot in FILE (from the start of the trace file if it was taken on a different one)")
+
+#estimates the result of the cache hierarchy from part of the trace file, returning it in the shape of output.json (with confidence intervals)
+def run_sampled(args):
+    import Sampling   #imported here as sampling reads the trace file with NumPy (if it is installed), which the other runs don't need
+
+    try:
+        if args.sample_sets:
+            sampler = Sampling.SetSampler(cache_hierarchy, args.sample_sets)
+        else:
+            sampler = Sampling.TimeSampler(cache_hierarchy, args.sample_period, args.sample_window, args.sample_warm_up)
+    except ValueError as e:
+        print(e)
+        return None
+
+    try:
+        sampler.run(args.trace_file)
+    except FileNotFoundError:
+        print(f"File not found: {args.trace_file}")
+    except Exception as e:
+        print(f"Error: {e}")
+
+    return sampler.results()
+
+#compares the estimate of a sampled run with the result of a full run of the same trace file
+def validate_main(argv):
+    parser = argparse.ArgumentParser(prog="python Cache_Simulator.py validate", description="compare a sampled run with a full run of the same trace file")
+    parser.add_argument("config_file")
+    parser.add_argument("trace_file")
+    add_sampling_arguments(parser)
+    parser.add_argument("--output", default="validation_output.json", help="file the comparison is written to (default: validation_output.json)")
+    args = parser.parse_args(argv)
+
+    if not args.sample_sets and not args.sample_period:
+        print("Give --sample-sets or --sample-period to validate")
+        return
+
+    cache_config = read_config(args.config_file)
+    if not cache_config:
+        return
+    set_up_cache(cache_config)
+    trace_program(args.trace_file)   #full run
+    full = get_stats()
+
+    reset_simulator()   #sampled run on a fresh cache hierarchy
+    set_up_cache(cache_config)
+    sampled = run_sampled(args)
+    if sampled is None:
+        return
+
+    #relative error of each estimate and whether the full result is inside its confidence interval
+    rows = [(cache['name'] + " " + counter, cache[counter], estimate[counter], estimate[counter + "_ci"])
+            for cache, estimate in zip(full['caches'], sampled['caches']) for counter in ("hits", "misses")]
+    rows.append(("main_memory_access", full['main_memory_access'], sampled['main_memory_access'], sampled['main_memory_access_ci']))
+
+    output_JSON = {"sampling": sampled['sampling'], "counters": []}
+    for name, exact, estimate, interval in rows:
+        error = abs(estimate - exact) / exact if exact else 0.0
+        within = interval[0] <= exact <= interval[1]
+        output_JSON['counters'].append({"name": name, "full": exact, "estimate": estimate, "ci": interval, "relative_error": error, "within_ci": within})
+        print(f"{name}: full {exact}, estimate {estimate} {interval}, error {error:.2%}{'' if within else ' (outside the confidence interval)'}")
+
+    with open(args.output, 'w') as file:
+        json.dump(output_JSON, file, indent=4)
+
+#converts a text trace file into the binary trace format so it doesn't need to be parsed again on later runs
+def convert_main(argv):
+    parser = argparse.ArgumentParser(prog="python Cache_Simulator.py convert", description="convert a text trace file into a binary trace file")
+    parser.add_argument("text_trace_file")
+    parser.add_argument("binary_trace_file")
+    args = parser.parse_args(argv)
+
+    try:
+        record_num = Trace_File.convert_trace(args.text_trace_file, args.binary_trace_file)
+        print(f"Wrote {record_num} records to {args.binary_trace_file}")
+    except FileNotFoundError:
+        print(f"File not found: {args.text_trace_file}")
+    except Exception as e:
+        print(f"Error: {e}")
+
+#collapses each run of consecutive accesses to the same cache line of the first cache level into one record of a compacted trace file
+def compact_main(argv):
+    parser = argparse.ArgumentParser(prog="python Cache_Simulator.py compact", description="collapse runs of accesses to the same cache line into a compacted trace file")
+    parser.add_argument("config_file")
+    parser.add_argument("trace_file")
+    parser.add_argument("compacted_trace_file")
+    args = parser.parse_args(argv)
+
+    cache_levels = read_config(args.config_file).get('caches', [])
+    if not cache_levels:
+        print("The configuration needs a cache level to compact the trace file for")
+        return
+
+    try:
+        record_num = Trace_File.compact_trace(args.trace_file, args.compacted_trace_file, cache_levels[0]['line_size'])   #lines of the first level, which every run hits after its first access
+        print(f"Wrote {record_num} records to {args.compacted_trace_file}")
+    except FileNotFoundError:
+        print(f"File not found: {args.trace_file}")
+    except Exception as e:
+        print(f"Error: {e}")
     
-#reads the configuration file and prases the JSON data
+#reports the hits and misses of a least recently used cache level at several sizes from a single pass through the trace file
+def sweep_main(argv):
+    parser = argparse.ArgumentParser(prog="python Cache_Simulator.py sweep", description="sweep the last cache level in the configuration over the sizes in its 'sizes' list")
+    parser.add_argument("config_file")
+    parser.add_argument("trace_file")
+    parser.add_argument("--output", default="sweep_output.json", help="file the sweep results are written to (default: sweep_output.json)")
+    args = parser.parse_args(argv)
+
+    cache_levels = read_config(args.config_file).get('caches', [])
+    if not cache_levels or 'sizes' not in cache_levels[-1] or any('sizes' in cache for cache in cache_levels[:-1]):
+        print("The last cache level (and only that one) needs a 'sizes' list to sweep over")
+        return
+
+    try:
+        sweep = Stack_Distance.LevelSweep(cache_levels[-1])
+        fixed_levels = [create_cache_level(cache) for cache in cache_levels[:-1]]   #the levels above the swept one are simulated as usual
+    except ValueError as e:
+        print(e)
+        return
+
+    try:
+        for address in Trace_File.read_addresses(args.trace_file):
+            for cache in fixed_levels:
+                if cache.search_cache(address):
+                    break
+            else:
+                sweep.access(address)   #only the misses of the levels above reach the swept level
+    except FileNotFoundError:
+        print(f"File not found: {args.trace_file}")
+    except Exception as e:
+        print(f"Error: {e}")
+
+    output_JSON = {"sweep": []}   #one entry (in the same shape as output.json) for each size
+    for size, hits, misses in sweep.results():
+        caches = [{"hits": cache.hits, "misses": cache.misses, "name": cache.name} for cache in fixed_levels]
+        caches.append({"hits": hits, "misses": misses, "name": sweep.name, "size": size})
+        output_JSON['sweep'].append({"caches": caches, "main_memory_access": misses})
+
+    with open(args.output, 'w') as file:
+        json.dump(output_JSON, file, indent=4)
+
+#simulates every configuration file given (or found in the directories given) against one trace file, each in its own worker process
+def batch_main(argv):
+    parser = argparse.ArgumentParser(prog="python Cache_Simulator.py batch", description="simulate many configurations against one trace file in parallel")
+    parser.add_argument("trace_file")
+    parser.add_argument("configs", nargs="+", help="configuration files or directories of them")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of cores)")
+    parser.add_argument("--engine", choices=["line", "numpy"], default="line", help="simulate one address at a time (default) or a chunk at a time with NumPy")
+    parser.add_argument("--output", default="batch_output.json", help="file the combined results are written to (default: batch_output.json)")
+    args = parser.parse_args(argv)
+
+    if args.engine == "numpy" and not Trace_File.numpy_available():
+        print("NumPy is not installed, falling back to the per-line simulation")
+        args.engine = "line"
+
+    #reads every configuration file, named after the file
+    configs = {}
+    errors = {}   #configuration files that couldn't be read, recorded in the results instead
+    output_file = os.path.abspath(args.output)
+    for path in args.configs:
+        directory = os.path.isdir(path)
+        files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".json")) if directory else [path]
+        for config_file in files:
+            if directory and os.path.abspath(config_file) == output_file:   #the results of an earlier batch run
+                continue
+
+            name = os.path.splitext(os.path.basename(config_file))[0]
+            name = name if name not in configs and name not in errors else config_file
+            try:
+                with open(config_file, 'r') as file:
+                    cache_config = json.load(file)
+                if not isinstance(cache_config, dict) or 'caches' not in cache_config:
+                    if directory:   #other JSON files in the directory (such as results) aren't configurations
+                        continue
+                    raise ValueError("No 'caches' array found in the configuration")
+            except (OSError, ValueError) as e:   #one broken configuration doesn't stop the others
+                print(f"Error in {name}: {e}")
+                errors[name] = {"error": str(e)}
+                continue
+            configs[name] = cache_config
+
+    import Parallel_Runner   #imported here so the process pool is only loaded by this subcommand
+    try:
+        trace = Parallel_Runner.SharedTrace.from_trace_file(args.trace_file)   #decodes the trace file once for every worker
+    except FileNotFoundError:
+        print(f"File not found: {args.trace_file}")
+        return
+
+    try:
+        results = Parallel_Runner.run_configs(trace, configs, simulate_addresses, args.engine, args.workers)
+    finally:
+        trace.close(unlink=True)
+    results.update(errors)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=4)
+
+#simulates one configuration against an array of decoded memory addresses and returns the result (used by the batch worker processes)
+def simulate_addresses(cache_config, addresses, engine="line"):
+    import Batch_Engine   #imported here so NumPy is only loaded where the batch engine (or the shared trace) needs it
+    global mem_access
+    reset_simulator()   #each configuration starts from an empty cache hierarchy
+    set_up_cache(cache_config)
+
+    if engine == "numpy":
+        engine = Batch_Engine.BatchEngine(cache_hierarchy, level_shards)
+        for start in range(0, len(addresses), Batch_Engine.BINARY_CHUNK_SIZE):
+            engine.mem_access += engine.simulate_chunk(addresses[start:start + Batch_Engine.BINARY_CHUNK_SIZE])
+        mem_access = engine.mem_access
+        engine.finish()
+    else:
+        for start in range(0, len(addresses), Batch_Engine.BINARY_CHUNK_SIZE):   #converted to ints a chunk at a time instead of one NumPy scalar at a time
+            for address in addresses[start:start + Batch_Engine.BINARY_CHUNK_SIZE].tolist():
+                access_cache_heirarcy(address)
+
+    return get_stats()
+
+#reads the configuration file and prases the JSON data (returning an empty configuration if it can't be read)
 def read_config(config_file):
+    json_data = {}
     try:
         with open(config_file, 'r') as file:
             json_data = json.load(file)   #parses the JSON file
@@ -44,37 +337,173 @@ def set_up_cache(cache_config):
 
     if cache_levels:
         for cache in cache_levels:
-            if len(cache) == 4:   #conditional based on whether replacement policy has been specified or not
-                cache_instance = CacheLevel(cache['name'], cache['size'], cache['line_size'], cache['kind'], "")  #creates a Cache_Level object with the relevant configuration information
-            else: 
-                cache_instance = CacheLevel(cache['name'], cache['size'], cache['line_size'], cache['kind'], cache['replacement_policy'])
+            cache_instance = create_cache_level(cache)
             cache_hierarchy.append(cache_instance)   #adds the cache level to the cache hierarchy list 
+
+            if cache.get('shards', 1) > 1:   #checks whether the cache level should be split across several worker processes
+                level_shards[cache_instance] = cache['shards']
     else:
         print("No 'cache' array found in the JSON data.")
 
-#reads each line in the trace file to simulate running a program   
-def trace_program(trace_file):
+#empties the cache hierarchy and the main memory access count so another configuration can be simulated in the same process
+def reset_simulator():
+    global cache_hierarchy, mem_access, level_shards, instrumentation
+    cache_hierarchy = []
+    mem_access = 0
+    level_shards = {}
+    instrumentation = None
+
+#creates a Cache_Level object with the configuration information of one cache level
+def create_cache_level(cache):
+    replacement_policy = cache.get('replacement_policy', "")   #empty if the replacement policy hasn't been specified
+    per_set_rr = cache.get('per_set_rr', False)   #the original round robin counter is shared by every set unless a counter for each set is asked for
+    return CacheLevel(cache['name'], cache['size'], cache['line_size'], cache['kind'], replacement_policy, per_set_rr)
+
+#reads each line in the trace file to simulate running a program (passing each memory address to the given access function, if any)
+def trace_program(trace_file, access=None):
+    if access is None:
+        access = access_cache_heirarcy
+
+    try:
+        if access is access_cache_heirarcy and Trace_File.is_binary_trace(trace_file):
+            with Trace_File.TraceReader(trace_file) as reader:
+                if reader.flags & Trace_File.COMPACTED:   #each run of a compacted trace file is simulated at once
+                    access_runs(reader.records())
+                    return
+
+        for mem_addr in Trace_File.read_addresses(trace_file):   #text, binary or compressed trace file
+            access(mem_addr)   #passes the memory address to check with the cache hierarchy
+
+    except FileNotFoundError:
+        print(f"File not found: {trace_file}")
+    except Exception as e:
+        print(f"Error: {e}")
+
+#runs the per-line simulation from a checkpoint (if resuming) and saves checkpoints as it goes, returning whether it ran
+def trace_program_checkpointed(args, cache_config):
+    global mem_access
+    position = 0   #byte offset (text trace file) or record number (binary trace file) to start from
+
+    if args.resume:
+        try:
+            snapshot = Checkpoint.load_checkpoint(args.resume)
+            position = Checkpoint.resume_position(snapshot, args.trace_file)
+        except FileNotFoundError as e:
+            print(f"File not found: {e.filename}")
+            return False
+        except Exception as e:
+            print(f"Error: {e}")
+            return False
+
+        if snapshot['config'] != cache_config.get('caches', []):
+            print(f"The checkpoint {args.resume} was taken with a different configuration")
+            return False
+        if position == 0:
+            print(f"The checkpoint {args.resume} was taken on a different trace file, so its cache state is continued from the start of {args.trace_file}")
+
+        Checkpoint.restore_levels(snapshot, cache_hierarchy)   #continues with the cache state of the snapshot in the levels set up from the configuration
+        mem_access = snapshot['mem_access']
+
+    save = None
+    if args.checkpoint:
+        save = lambda position: Checkpoint.save_checkpoint(args.checkpoint, cache_config, cache_hierarchy, mem_access, args.trace_file, position)
+    trace_program_from(args.trace_file, position, save, args.checkpoint_every)
+    return True
+
+#reads the trace file from the given position (byte offset or record number), calling save with the position reached every `every` accesses and at the end
+def trace_program_from(trace_file, position, save=None, every=0):
+    accesses = 0   #number of accesses since the last checkpoint
+
+    try:
+        if Trace_File.is_binary_trace(trace_file):
+            with Trace_File.TraceReader(trace_file) as reader:
+                compacted = reader.flags & Trace_File.COMPACTED   #the position is then a record number, with each record a run of accesses
+                for mem_addr, size in reader.records(position):
+                    access_cache_heirarcy(mem_addr)
+                    if compacted and size > 1:
+                        cache_hierarchy[0].repeat_hits(mem_addr, size - 1)
+                    position += 1
+                    accesses += 1
+                    if accesses == every and save is not None:
+                        accesses = 0
+                        save(position)
+        else:
+            with Trace_File.open_trace_bytes(trace_file) as file:   #read as bytes so the byte offset of each line is known (in the decompressed trace file, if it is compressed)
+                if file.read(len(Trace_File.MAGIC)) == Trace_File.MAGIC:   #only reached by a compressed binary trace file
+                    print("Checkpoints need a text trace file or an uncompressed binary trace file")
+                    return
+                file.seek(position)
+                for line in file:
+                    position += len(line)
+                    decoded = Trace_File.decode_line(line)
+                    if decoded is None:
+                        continue
+
+                    access_cache_heirarcy(decoded[0])
+                    accesses += 1
+                    if accesses == every and save is not None:
+                        accesses = 0
+                        save(position)
+
+        if save is not None:   #the final checkpoint can be resumed with other trace files to fork what-if continuations
+            save(position)
+
+    except FileNotFoundError:
+        print(f"File not found: {trace_file}")
+    except Exception as e:
+        print(f"Error: {e}")
+
+#reads the trace file, collapsing each run of accesses to the same line of the first cache level as it goes
+def trace_program_compacted(trace_file):
+    if not cache_hierarchy:
+        trace_program(trace_file)
+        return
+
+    try:
+        access_runs(Trace_File.compact_runs(Trace_File.read_addresses(trace_file), cache_hierarchy[0].offset_bits))
+    except FileNotFoundError:
+        print(f"File not found: {trace_file}")
+    except Exception as e:
+        print(f"Error: {e}")
+
+#passes the first access of each run of accesses to the same cache line through the cache hierarchy, then counts the rest of the run as hits in the first level
+def access_runs(runs):
+    first_level = cache_hierarchy[0]
+    for mem_addr, repeats in runs:
+        access_cache_heirarcy(mem_addr)
+        if repeats > 1:   #the cache line is now in the first level, so it hits on every repeat
+            first_level.repeat_hits(mem_addr, repeats - 1)
+
+#runs the per-line simulation through the instrumentation
+def trace_program_instrumented(args):
+    global instrumentation, mem_access
+    instrumentation = Instrumentation.Instrumentation(cache_hierarchy, args.interval, args.interval_output, args.progress, args.conflicts)
+    if args.progress:
+        instrumentation.estimate_total(args.trace_file)   #for the ETA
+
+    try:
+        trace_program(args.trace_file, instrumentation.access)
+    finally:
+        mem_access += instrumentation.mem_access   #counts the main memory accesses made through the instrumentation
+        instrumentation.finish()   #writes the last interval
+
+#reads the trace file in chunks and simulates each chunk with the NumPy batch engine
+def trace_program_batch(trace_file, compact=False):
+    import Batch_Engine   #imported here so NumPy is only loaded with --engine numpy
+    global mem_access
+    engine = Batch_Engine.BatchEngine(cache_hierarchy, level_shards)
+
     try:
-        with open(trace_file, 'r') as file:
-            for line in file:   #reads each line of the trace file
-                line = line.strip()
-                data = line.split()
-                
-                if len(data) == 4:   #conditional based on whether all the required fields are present in each line
-                    mem_addr = data[1]   #reads the memory address
-                    size = data[3]   #reads the size of the data (not utilised)
-                else:
-                    print(f"Invalid line: {line}")
-                    continue
-
-                access_cache_heirarcy(mem_addr)   #passes the memory address to check with the cache hierarchy
-                
+        engine.trace_program(trace_file, compact)
     except FileNotFoundError:
         print(f"File not found: {trace_file}")
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        mem_access += engine.mem_access   #counts the main memory accesses of every chunk simulated
+        engine.finish()   #writes the cache state back to the cache levels
 
-#takes a memory address from the trace file to and checks each cache level for its presence
+#takes a memory address (as an int) from the trace file to and checks each cache level for its presence
 def access_cache_heirarcy(address):
     global mem_access
 
@@ -86,19 +515,30 @@ def access_cache_heirarcy(address):
 
     mem_access += 1   #checks the main memory if memory address causes a miss in all the cache levels
 
-#outputs the result
-def output_stats(output_file):
+#gets the result of going through the trace file for each cache level in the hierachy 
+def get_stats():
     output_JSON = {"caches": [], "main_memory_access": mem_access}   #JSON representation for the output 
 
-    for cache in cache_hierarchy:   #gets the result of going through the trace file for each cache level in the hierachy 
+    for cache in cache_hierarchy:
         output_JSON['caches'].append({
             "hits": cache.hits,
             "misses": cache.misses,
             "name": cache.name
         })
+
+    if instrumentation is not None:   #adds the evictions and conflict misses of each level
+        instrumentation.add_stats(output_JSON)
+
+    return output_JSON
+
+#outputs the result
+def output_stats(output_file):
+    output_JSON = get_stats()
     
     with open(output_file, 'w') as file:
         json.dump(output_JSON, file, indent=4)   #writes the results to the output JSON file
 
+SUBCOMMANDS = {"convert": convert_main, "compact": compact_main, "sweep": sweep_main, "batch": batch_main, "validate": validate_main}   #subcommands that can be given in place of the configuration file
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
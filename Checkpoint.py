@@ -0,0 +1,109 @@
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+'''
+This file contains the functions that save and load checkpoints of a simulation run.
+
+A checkpoint is a compressed snapshot of every cache level (contents, replacement state and counters), the main memory access count,
+the configuration, and the position reached in the trace file (a byte offset for text trace files, or a record number for binary ones).
+The file starts with a magic number and a version, followed by the zlib compressed snapshot: the length of a JSON description, the
+description itself (the configuration, counters and position, and the typecode and length of each array of every level's state), and
+then the raw bytes of those arrays in the same order. Nothing is pickled, so a checkpoint only depends on this format and the levels are
+rebuilt from the configuration and their saved state. Checkpoints are written to a temporary file first and then renamed, so a run killed
+while writing one still leaves the previous checkpoint intact.
+'''
+
+MAGIC = b"CSCHKPT\x00"   #identifies a checkpoint file
+VERSION = 3   #version of the checkpoint format (3: explicit state of each level instead of pickled Cache_Level objects)
+HEADER = struct.Struct("<8sH")   #magic number and version
+DESCRIPTION_SIZE = struct.Struct("<I")   #length of the JSON description at the start of the compressed snapshot
+COMPRESSION_LEVEL = 1   #zlib compression level (cache contents compress well even at the fastest level)
+
+
+#writes a checkpoint of the cache hierarchy, which has simulated the trace file up to the given position
+def save_checkpoint(checkpoint_file, cache_config, cache_hierarchy, mem_access, trace_file, position):
+    levels = []   #state of each level, with each array replaced by its typecode and length
+    data = []   #bytes of every array, in the order they appear in the description
+    for cache in cache_hierarchy:
+        level = {}
+        for name, value in cache.get_state().items():
+            if isinstance(value, int):
+                level[name] = value
+            else:
+                typecode = value.typecode if isinstance(value, array) else "bytes"
+                level[name] = {"typecode": typecode, "itemsize": value.itemsize if typecode != "bytes" else 1, "length": len(value)}
+                data.append(bytes(value))
+        levels.append(level)
+
+    description = json.dumps({
+        "config": cache_config.get('caches', []),
+        "levels": levels,
+        "mem_access": mem_access,
+        "trace_file": os.path.abspath(trace_file),
+        "trace_size": os.path.getsize(trace_file),
+        "position": position,
+        "byteorder": sys.byteorder
+    }).encode()
+    compressor = zlib.compressobj(COMPRESSION_LEVEL)
+
+    temp_file = checkpoint_file + ".tmp"
+    with open(temp_file, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION))
+        for block in [DESCRIPTION_SIZE.pack(len(description)), description] + data:
+            file.write(compressor.compress(block))
+        file.write(compressor.flush())
+    os.replace(temp_file, checkpoint_file)   #replaces the previous checkpoint in one step
+
+#reads a checkpoint, returning the snapshot (with the state of each level under 'levels', to be restored into levels created from 'config')
+def load_checkpoint(checkpoint_file):
+    with open(checkpoint_file, 'rb') as file:
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size or HEADER.unpack(header)[0] != MAGIC:
+            raise ValueError(f"Not a checkpoint file: {checkpoint_file}")
+        if HEADER.unpack(header)[1] != VERSION:
+            raise ValueError(f"Unsupported checkpoint version: {HEADER.unpack(header)[1]}")
+        body = memoryview(zlib.decompress(file.read()))
+
+    size, = DESCRIPTION_SIZE.unpack_from(body)
+    snapshot = json.loads(bytes(body[DESCRIPTION_SIZE.size:DESCRIPTION_SIZE.size + size]))
+    offset = DESCRIPTION_SIZE.size + size
+    swap = snapshot['byteorder'] != sys.byteorder   #arrays are saved in the byte order of the machine that wrote them
+
+    for level in snapshot['levels']:
+        for name, value in level.items():
+            if isinstance(value, int):
+                continue
+
+            end = offset + value['itemsize'] * value['length']
+            if end > len(body):
+                raise ValueError(f"The checkpoint {checkpoint_file} is truncated or corrupted")
+            if value['typecode'] == "bytes":
+                level[name] = bytearray(body[offset:end])
+            else:
+                values = array(value['typecode'])
+                if values.itemsize != value['itemsize']:
+                    raise ValueError(f"The checkpoint {checkpoint_file} was written with {value['itemsize']} byte '{value['typecode']}' arrays, which are {values.itemsize} bytes here")
+                values.frombytes(body[offset:end])
+                if swap:
+                    values.byteswap()
+                level[name] = values
+            offset = end
+
+    if offset != len(body):
+        raise ValueError(f"The checkpoint {checkpoint_file} is truncated or corrupted")
+    return snapshot
+
+#restores the state of each level in the snapshot into the cache hierarchy (created from the same configuration)
+def restore_levels(snapshot, cache_hierarchy):
+    for cache, state in zip(cache_hierarchy, snapshot['levels']):
+        cache.restore_state(state)
+
+#returns the position to continue the trace file from, which is its start if the snapshot was taken on a different trace file (a what-if continuation)
+def resume_position(snapshot, trace_file):
+    if snapshot['trace_file'] == os.path.abspath(trace_file) and snapshot['trace_size'] == os.path.getsize(trace_file):
+        return snapshot['position']
+    return 0
@@ -0,0 +1,208 @@
+import argparse
+import contextlib
+import copy
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import Batch_Engine
+import Cache_Simulator
+import Checkpoint
+import Trace_File
+import Trace_Generator
+
+'''
+This file contains the equivalence check for the simulator.
+
+Every configuration in a directory (equivalence_configs by default) is run against synthetic traces of each access pattern with the
+per-line simulation of the text trace file, which is the reference. The same configuration is then run through every other engine
+and mode (the NumPy batch engine, binary, compressed and compacted trace files, --compact, sharded levels on text and compacted trace
+files, a killed and resumed run, the batch subcommand and the sweep), and any result that isn't exactly the same as the reference is
+reported.
+'''
+
+MODES = ["numpy", "binary", "binary_numpy", "compressed", "compressed_numpy", "compact", "compact_numpy", "compacted", "compacted_numpy",
+         "shards", "compacted_shards", "resume", "resume_binary", "batch", "batch_numpy", "sweep"]   #engines and modes compared with the per-line simulation
+NUMPY_MODES = {"numpy", "binary_numpy", "compressed_numpy", "compact_numpy", "compacted_numpy", "shards", "compacted_shards", "batch_numpy"}   #modes that need NumPy
+CONFIG_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "equivalence_configs")   #default directory of the configurations
+
+
+class StopRun(BaseException):   #stands in for the run being killed (the simulator catches every Exception)
+    pass
+
+
+#runs a configuration on a fresh cache hierarchy with the given function simulating the trace and returns the result
+def run(cache_config, simulate):
+    Cache_Simulator.reset_simulator()
+    Cache_Simulator.set_up_cache(cache_config)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):   #hides the messages of the simulator (and the pipeline report)
+        simulate()
+    return Cache_Simulator.get_stats()
+
+#runs a configuration until its first checkpoint is saved, then continues it from that checkpoint in a fresh cache hierarchy
+def run_resumed(cache_config, trace_file, checkpoint_file, every):
+    def save_and_stop(position):
+        Checkpoint.save_checkpoint(checkpoint_file, cache_config, Cache_Simulator.cache_hierarchy, Cache_Simulator.mem_access, trace_file, position)
+        raise StopRun
+
+    def first_part():
+        try:
+            Cache_Simulator.trace_program_from(trace_file, 0, save_and_stop, every)
+        except StopRun:
+            pass
+
+    run(cache_config, first_part)
+    args = argparse.Namespace(trace_file=trace_file, resume=checkpoint_file, checkpoint=None, checkpoint_every=every)
+    return run(cache_config, lambda: Cache_Simulator.trace_program_checkpointed(args, cache_config))
+
+#adds worker processes to every fully or set-associative level (the batch engine leaves the levels it can't shard in this process)
+def sharded_config(cache_config):
+    cache_config = copy.deepcopy(cache_config)
+    for cache in cache_config['caches']:
+        if cache['kind'] not in ("direct", "full"):
+            cache['shards'] = 2
+    return cache_config
+
+#sweeps the last level of a configuration over half, the same and double its size, returning the result of each size (in the shape of output.json)
+def run_sweep(cache_config, trace_file, directory):
+    sweep_config = copy.deepcopy(cache_config)
+    size = sweep_config['caches'][-1].pop('size')
+    sizes = [size // 2, size, size * 2]
+    sweep_config['caches'][-1]['sizes'] = sizes
+
+    config_file = os.path.join(directory, "sweep_config.json")
+    output_file = os.path.join(directory, "sweep_output.json")
+    with open(config_file, 'w') as file:
+        json.dump(sweep_config, file)
+    with contextlib.redirect_stdout(io.StringIO()):
+        Cache_Simulator.sweep_main([config_file, trace_file, "--output", output_file])
+    with open(output_file, 'r') as file:
+        sweep = json.load(file)['sweep']
+
+    results = {}
+    for size, result in zip(sizes, sweep):
+        result['caches'][-1].pop('size')
+        results[size] = result
+    return results
+
+#runs every configuration in the batch subcommand (in worker processes), returning the results keyed by configuration name
+def run_batch(trace_file, config_directory, engine, directory):
+    output_file = os.path.join(directory, "batch_output.json")
+    with contextlib.redirect_stdout(io.StringIO()):
+        Cache_Simulator.batch_main([trace_file, config_directory, "--engine", engine, "--output", output_file])
+    with open(output_file, 'r') as file:
+        return json.load(file)
+
+#writes the trace files of a pattern (text with an invalid line, binary and gzip compressed), returning their names by format
+def write_traces(pattern, length, footprint, seed, directory):
+    text_file = os.path.join(directory, f"{pattern}.txt")
+    Trace_Generator.write_trace(text_file, pattern, length, footprint, seed)
+    with open(text_file, 'r') as file:
+        lines = file.readlines()
+    lines.insert(min(5, len(lines)), "invalid line\n")   #every reader skips it in the same way
+    with open(text_file, 'w') as file:
+        file.writelines(lines)
+
+    traces = {"text": text_file, "binary": os.path.join(directory, f"{pattern}.bin"), "compressed": text_file + ".gz"}
+    with contextlib.redirect_stdout(io.StringIO()):
+        Trace_File.convert_trace(text_file, traces['binary'])
+    with open(text_file, 'rb') as source, gzip.open(traces['compressed'], 'wb') as compressed:
+        shutil.copyfileobj(source, compressed)
+    return traces
+
+#compares every mode with the reference on one trace, returning the names of the mismatching cases
+def check_pattern(pattern, traces, configs, config_directory, modes, directory):
+    mismatches = []
+    compacted = {}   #compacted trace file of each line size
+
+    def compare(name, mode, result, reference):
+        if result != reference:
+            mismatches.append(f"{pattern}/{name}/{mode}")
+            print(f"{pattern}/{name}/{mode}: MISMATCH\n  per-line: {reference}\n  {mode}: {result}")
+
+    batch = {}
+    for engine, mode in (("line", "batch"), ("numpy", "batch_numpy")):
+        if mode in modes:
+            batch[mode] = run_batch(traces['text'], config_directory, engine, directory)
+
+    for name, cache_config in configs.items():
+        reference = run(cache_config, lambda: Cache_Simulator.trace_program(traces['text']))
+        line_size = cache_config['caches'][0]['line_size']
+        if line_size not in compacted and {"compacted", "compacted_numpy", "compacted_shards"} & set(modes):
+            compacted[line_size] = os.path.join(directory, f"{pattern}_{line_size}.cbin")
+            with contextlib.redirect_stdout(io.StringIO()):
+                Trace_File.compact_trace(traces['text'], compacted[line_size], line_size)
+
+        simulations = {
+            "numpy": lambda: Cache_Simulator.trace_program_batch(traces['text']),
+            "binary": lambda: Cache_Simulator.trace_program(traces['binary']),
+            "binary_numpy": lambda: Cache_Simulator.trace_program_batch(traces['binary']),
+            "compressed": lambda: Cache_Simulator.trace_program(traces['compressed']),
+            "compressed_numpy": lambda: Cache_Simulator.trace_program_batch(traces['compressed']),
+            "compact": lambda: Cache_Simulator.trace_program_compacted(traces['text']),
+            "compact_numpy": lambda: Cache_Simulator.trace_program_batch(traces['text'], True),
+            "compacted": lambda: Cache_Simulator.trace_program(compacted[line_size]),
+            "compacted_numpy": lambda: Cache_Simulator.trace_program_batch(compacted[line_size]),
+        }
+        for mode in modes:
+            if mode in simulations:
+                compare(name, mode, run(cache_config, simulations[mode]), reference)
+            elif mode == "shards":
+                compare(name, mode, run(sharded_config(cache_config), simulations['numpy']), reference)
+            elif mode == "compacted_shards":
+                compare(name, mode, run(sharded_config(cache_config), simulations['compacted_numpy']), reference)
+            elif mode in ("resume", "resume_binary"):
+                trace_file = traces['text' if mode == "resume" else 'binary']
+                compare(name, mode, run_resumed(cache_config, trace_file, os.path.join(directory, "checkpoint.bin"), 1000), reference)
+            elif mode in batch:
+                compare(name, mode, batch[mode].get(name), reference)
+
+        last_level = cache_config['caches'][-1]
+        if "sweep" in modes and (last_level['kind'] == "direct" or last_level.get('replacement_policy') == "lru"):
+            for size, result in run_sweep(cache_config, traces['text'], directory).items():
+                sized_config = copy.deepcopy(cache_config)
+                sized_config['caches'][-1]['size'] = size
+                compare(f"{name}@{size}", "sweep", result, run(sized_config, lambda: Cache_Simulator.trace_program(traces['text'])))
+
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="check that every engine and mode gives exactly the same result as the per-line simulation")
+    parser.add_argument("--configs", default=CONFIG_DIRECTORY, help="directory of configuration files (default: equivalence_configs)")
+    parser.add_argument("--length", type=int, default=20000, help="number of accesses in each trace (default: 20000)")
+    parser.add_argument("--footprint", type=int, default=1 << 17, help="number of bytes the accesses are spread over (default: 128 KB)")
+    parser.add_argument("--patterns", nargs="+", choices=Trace_Generator.PATTERNS, default=Trace_Generator.PATTERNS, help="access patterns to generate (default: all)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES, help="engines and modes to compare (default: all)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the traces (default: 0)")
+    args = parser.parse_args()
+
+    modes = args.modes
+    if not Batch_Engine.is_available():
+        print("NumPy is not installed, so the batch engine modes are skipped")
+        modes = [mode for mode in modes if mode not in NUMPY_MODES]
+
+    configs = {}   #configurations named after their files, as the batch subcommand names them
+    for name in sorted(os.listdir(args.configs)):
+        if name.endswith(".json"):
+            configs[os.path.splitext(name)[0]] = Cache_Simulator.read_config(os.path.join(args.configs, name))
+
+    mismatches = []
+    with tempfile.TemporaryDirectory() as directory:
+        for pattern in args.patterns:
+            traces = write_traces(pattern, args.length, args.footprint, args.seed, directory)
+            pattern_mismatches = check_pattern(pattern, traces, configs, args.configs, modes, directory)
+            print(f"{pattern}: {len(configs)} configurations, {len(modes)} modes, {len(pattern_mismatches)} mismatches")
+            mismatches += pattern_mismatches
+
+    if mismatches:
+        print(f"{len(mismatches)} results differ from the per-line simulation")
+        sys.exit(1)
+    print("Every result is the same as the per-line simulation")
+
+if __name__ == "__main__":
+    main()
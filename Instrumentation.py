@@ -0,0 +1,172 @@
+import csv
+import json
+import os
+import sys
+import time
+
+import Trace_File
+
+'''
+This file contains the Instrumentation Class which adds opt-in measurements to a simulation run:
+- the hits, misses and evictions of each cache level in every interval of N accesses, streamed to a CSV or JSONL file
+- periodic progress (accesses/sec and ETA) on stderr
+- the number of conflict misses in each set of each cache level
+
+Nothing is added to the simulator loop or the search of the cache levels. When instrumentation is switched on, the trace file is passed
+through the access function of the Instrumentation object instead, which checks the state of each level around its search, so a run
+without it costs exactly what it did.
+
+A conflict miss is a miss that a fully-associative least recently used cache with the same number of lines would have hit, so each
+instrumented level keeps such a cache alongside it to classify its misses.
+'''
+
+PROGRESS_CHECK = 1 << 14   #number of accesses between checks of the clock for progress reports
+LINE_LENGTH_SAMPLE = 1 << 16   #number of bytes read from the start of a text trace file to estimate its number of lines
+INTERVAL_FIELDS = ["interval", "accesses", "cache", "hits", "misses", "evictions"]   #columns (or keys) of each row of the time series
+
+
+class LevelProbe:
+    def __init__(self, cache, conflicts):
+        self.cache = cache   #Cache_Level object being instrumented
+        self.evictions = 0   #number of valid cache lines replaced
+        self.conflict_misses = {} if conflicts else None   #number of conflict misses in each set (if they are being classified)
+        self.shadow = {}   #fully-associative least recently used cache of the same number of lines (least recently used first)
+
+    #searches the cache level for the memory address, counting an eviction if it misses in a full set and classifying the miss
+    def search_cache(self, address):
+        cache = self.cache
+        line = address >> cache.offset_bits
+        index_int = line & cache.index_mask
+        full = cache.is_set_full(index_int)
+
+        if self.conflict_misses is not None:
+            shadow_hit = self.shadow.pop(line, None) is not None   #checks (and updates) the fully-associative cache
+            self.shadow[line] = True
+            if len(self.shadow) > cache.line_num:
+                del self.shadow[next(iter(self.shadow))]
+
+        if cache.search_cache(address):
+            return True
+
+        if full:
+            self.evictions += 1
+        if self.conflict_misses is not None and shadow_hit:   #missed only because of where the line maps to
+            self.conflict_misses[index_int] = self.conflict_misses.get(index_int, 0) + 1
+        return False
+
+
+class Instrumentation:
+    def __init__(self, cache_hierarchy, interval=0, interval_file=None, progress=0, conflicts=False):
+        self.cache_hierarchy = cache_hierarchy   #list of the Cache_Level objects in the hierarchy
+        self.interval = interval   #number of accesses in each interval of the time series (0 if there is none)
+        self.progress = progress   #seconds between progress reports (0 if there are none)
+        self.probes = [LevelProbe(cache, conflicts) for cache in cache_hierarchy]
+        self.accesses = 0   #number of accesses so far
+        self.mem_access = 0   #number of main memory accesses so far
+        self.total = None   #(estimated) number of accesses in the trace file, for the ETA
+        self.start_time = time.perf_counter()
+        self.last_report = self.start_time
+
+        self.interval_file = None
+        self.writer = None
+        if interval and interval_file:
+            self.interval_file = open(interval_file, 'w', newline="")
+            if interval_file.endswith(".csv"):
+                self.writer = csv.writer(self.interval_file)
+                self.writer.writerow(INTERVAL_FIELDS)
+        self.previous = [(0, 0, 0)] * len(cache_hierarchy)   #counters of each level at the end of the last interval
+        self.next_check = self.due_after(0)   #number of accesses at which check is next called
+
+    #passes a memory address through the instrumented cache levels in turn (in place of the simulator's own hierarchy access)
+    def access(self, address):
+        for probe in self.probes:
+            if probe.search_cache(address):
+                break
+        else:
+            self.mem_access += 1
+
+        self.accesses += 1
+        if self.accesses == self.next_check:
+            self.check()
+
+    #number of accesses at which the next interval ends or the clock is next checked for a progress report
+    def due_after(self, accesses):
+        due = []
+        if self.interval:
+            due.append(accesses - accesses % self.interval + self.interval)
+        if self.progress:
+            due.append(accesses + PROGRESS_CHECK)
+        return min(due) if due else 0
+
+    #estimates the number of accesses in the trace file so the progress reports can give an ETA
+    def estimate_total(self, trace_file):
+        try:
+            if Trace_File.is_compressed_trace(trace_file):   #the length of the decompressed trace file isn't known
+                self.total = None
+                return
+
+            if Trace_File.is_binary_trace(trace_file):
+                with Trace_File.TraceReader(trace_file) as reader:
+                    self.total = None if reader.flags & Trace_File.COMPACTED else reader.record_num   #each record of a compacted trace file is a run of accesses
+                return
+
+            with open(trace_file, 'rb') as file:
+                sample = file.read(LINE_LENGTH_SAMPLE)
+            if sample.count(b"\n"):
+                self.total = int(os.path.getsize(trace_file) / (len(sample) / sample.count(b"\n")))
+        except (OSError, ValueError):
+            self.total = None
+
+    #writes the interval counters and reports the progress when they are due
+    def check(self):
+        if self.interval and self.accesses % self.interval == 0:
+            self.write_interval()
+
+        if self.progress:
+            now = time.perf_counter()
+            if now - self.last_report >= self.progress:
+                self.last_report = now
+                self.report_progress(now)
+
+        self.next_check = self.due_after(self.accesses)
+
+    #writes the hits, misses and evictions of each cache level since the last interval (the misses of the last level are the main memory accesses)
+    def write_interval(self):
+        current = [(cache.hits, cache.misses, probe.evictions) for cache, probe in zip(self.cache_hierarchy, self.probes)]
+        interval = (self.accesses - 1) // self.interval
+
+        if self.interval_file is not None:
+            for cache, (hits, misses, evictions), (previous_hits, previous_misses, previous_evictions) in zip(self.cache_hierarchy, current, self.previous):
+                row = [interval, self.accesses, cache.name, hits - previous_hits, misses - previous_misses, evictions - previous_evictions]
+                if self.writer is not None:
+                    self.writer.writerow(row)
+                else:
+                    self.interval_file.write(json.dumps(dict(zip(INTERVAL_FIELDS, row))) + "\n")
+            self.interval_file.flush()
+        self.previous = current
+
+    #reports the number of accesses, accesses/sec and ETA on stderr
+    def report_progress(self, now):
+        rate = self.accesses / (now - self.start_time) if now > self.start_time else 0
+        message = f"{self.accesses} accesses, {rate:.0f} accesses/sec"
+        if self.total and rate:
+            remaining = max(self.total - self.accesses, 0) / rate
+            message += f", {min(self.accesses / self.total, 1):.1%} done, ETA {remaining:.0f} s"
+        print(message, file=sys.stderr)
+
+    #writes the counters of the last (partial) interval and closes the interval file
+    def finish(self):
+        if self.interval and self.accesses % self.interval:
+            self.write_interval()
+        if self.interval_file is not None:
+            self.interval_file.close()
+        if self.progress:
+            self.report_progress(time.perf_counter())
+
+    #adds the evictions and conflict misses of each cache level to the output JSON
+    def add_stats(self, output_JSON):
+        for cache_JSON, probe in zip(output_JSON['caches'], self.probes):
+            cache_JSON['evictions'] = probe.evictions
+            if probe.conflict_misses is not None:
+                cache_JSON['conflict_misses'] = sum(probe.conflict_misses.values())
+                cache_JSON['conflict_miss_histogram'] = {str(index_int): count for index_int, count in sorted(probe.conflict_misses.items())}
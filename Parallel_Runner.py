@@ -0,0 +1,139 @@
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import Batch_Engine
+import Trace_File
+
+'''
+This file contains the SharedTrace Class and the process pool used to simulate many cache configurations against one trace file.
+
+The trace file is decoded once, a chunk at a time, straight into an array of uint64 memory addresses held in shared memory (sized from
+the number of records or lines in the trace file, so no second copy is held while decoding). Every worker process attaches to the
+same block of memory instead of reading (or being sent) its own copy of the trace, and simulates whole configurations independently.
+'''
+
+ADDRESS_BYTES = 8   #size of each decoded memory address in shared memory
+CHUNK_ADDRESSES = 1 << 16   #number of memory addresses decoded at a time without NumPy
+
+worker_trace = None   #the shared trace attached to by the current worker process
+
+
+class SharedTrace:
+    def __init__(self, name=None, length=0, create=False):
+        self.length = length   #number of memory addresses
+        self.memory = shared_memory.SharedMemory(name=name, create=create, size=max(length * ADDRESS_BYTES, 1))
+        self.name = self.memory.name
+
+    #decodes a text or binary trace file once into a new block of shared memory, writing each chunk of memory addresses straight into it
+    @classmethod
+    def from_trace_file(cls, trace_file):
+        trace = cls(length=expected_length(trace_file), create=True)
+        position = 0   #number of memory addresses decoded so far
+
+        try:
+            for chunk in read_chunks(trace_file):
+                if position + len(chunk) > trace.length:   #moves to a larger block of shared memory if the expected length was too small
+                    trace = trace.resized(max(2 * trace.length, position + len(chunk)), position)
+                trace.write(position, chunk)
+                position += len(chunk)
+        except (ValueError, OverflowError) as e:   #the simulation stops at the first address that can't be decoded
+            print(f"Error: {e}")
+        except BaseException:
+            trace.close(unlink=True)
+            raise
+
+        trace.length = position   #only the decoded memory addresses are used, even if the block of shared memory is larger
+        return trace
+
+    #copies a chunk of memory addresses (a NumPy array or an array of uint64) into the shared memory, starting at the given position
+    def write(self, position, chunk):
+        if Batch_Engine.is_available():
+            Batch_Engine.np.frombuffer(self.memory.buf, dtype=Batch_Engine.np.uint64, count=len(chunk), offset=position * ADDRESS_BYTES)[:] = chunk
+        else:
+            self.memory.buf[position * ADDRESS_BYTES:(position + len(chunk)) * ADDRESS_BYTES] = chunk.tobytes()
+
+    #returns a new block of shared memory for the given number of memory addresses holding the first ones of this one, which is freed
+    def resized(self, length, used):
+        trace = SharedTrace(length=length, create=True)
+        trace.memory.buf[:used * ADDRESS_BYTES] = self.memory.buf[:used * ADDRESS_BYTES]
+        self.close(unlink=True)
+        return trace
+
+    #zero-copy view of the memory addresses (a NumPy array if it is installed, otherwise a memoryview of ints)
+    def as_array(self):
+        if Batch_Engine.is_available():
+            return Batch_Engine.np.frombuffer(self.memory.buf, dtype=Batch_Engine.np.uint64, count=self.length)
+        return self.memory.buf[:self.length * ADDRESS_BYTES].cast('Q')
+
+    #detaches from the shared memory (and frees it if this process created it)
+    def close(self, unlink=False):
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+#returns the number of memory addresses a trace file is expected to hold: exact for a binary trace file, at most the number of lines of a
+#text trace file and only a first guess if it is compressed
+def expected_length(trace_file):
+    if Trace_File.is_compressed_trace(trace_file):
+        return os.path.getsize(trace_file)   #about one memory address for each compressed byte
+
+    if Trace_File.is_binary_trace(trace_file):
+        try:
+            with Trace_File.TraceReader(trace_file) as reader:
+                if reader.flags & Trace_File.COMPACTED and Batch_Engine.is_available():   #each record holds a run of accesses
+                    return sum(int(records["size"].sum()) for records in reader.chunks(Batch_Engine.BINARY_CHUNK_SIZE))
+                return reader.record_num
+        except ValueError:   #reported when the trace file is decoded
+            return 0
+
+    with open(trace_file, 'rb') as file:   #each line holds at most one memory address, and the last one may not end with a new line
+        return sum(block.count(b"\n") for block in iter(lambda: file.read(Batch_Engine.CHUNK_SIZE), b"")) + 1
+
+#yields the memory addresses of a trace file a chunk at a time (NumPy arrays if it is installed, otherwise arrays of uint64)
+def read_chunks(trace_file):
+    if Batch_Engine.is_available():
+        yield from Batch_Engine.read_chunks(trace_file)
+        return
+
+    chunk = array('Q')
+    try:
+        for address in Trace_File.read_addresses(trace_file):
+            chunk.append(address)
+            if len(chunk) == CHUNK_ADDRESSES:
+                yield chunk
+                chunk = array('Q')
+    except (ValueError, OverflowError):
+        yield chunk   #the addresses before one that can't be decoded are still simulated
+        raise
+    yield chunk
+
+
+#attaches a worker process to the shared trace
+def attach_trace(name, length):
+    global worker_trace
+    worker_trace = SharedTrace(name, length)   #the parent process owns (and frees) the shared memory
+
+
+#simulates one configuration against the shared trace in a worker process
+def run_config(simulate, cache_config, engine):
+    return simulate(cache_config, worker_trace.as_array(), engine)
+
+
+#simulates each configuration in a worker process, returning the results keyed by configuration name
+def run_configs(trace, configs, simulate, engine="line", workers=None):
+    workers = workers or os.cpu_count()
+    results = {}
+
+    with ProcessPoolExecutor(max_workers=min(workers, max(len(configs), 1)), initializer=attach_trace, initargs=(trace.name, trace.length)) as pool:
+        futures = {name: pool.submit(run_config, simulate, cache_config, engine) for name, cache_config in configs.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:   #one broken configuration doesn't stop the others
+                print(f"Error in {name}: {e}")
+                results[name] = {"error": str(e)}
+
+    return results
@@ -0,0 +1,159 @@
+import math
+
+import Batch_Engine
+import Trace_File
+from Cache_Level import CacheLevel
+
+'''
+This file contains the SetSampler and TimeSampler Classes which estimate the results of a full simulation from part of the trace.
+
+Set sampling only simulates the accesses that map to 1 in every `rate` sets (chosen by address bits just above the largest cache line
+offset, so the same sets are sampled in every level) and scales the counters up by `rate`. The sampled sets are split into groups by the
+next address bits, and the spread of the counts between the groups gives the confidence intervals. A fully-associative level has no
+sets to sample, so it is simulated with 1/rate of its lines instead.
+
+Time sampling simulates a window of `window` accesses at the end of every `period` accesses. The `warm_up` accesses before each window
+are simulated (to refill the caches) but not counted, and the rest are skipped. The counts are scaled up to the length of the trace and
+the spread of the counts between the windows gives the confidence intervals.
+'''
+
+Z_SCORE = 1.96   #normal score for a 95% confidence interval
+SET_GROUPS = 32   #number of groups the sampled sets are split into to estimate the confidence intervals
+SAMPLE_CHUNK = 1 << 16   #number of memory addresses read at a time when NumPy isn't installed
+
+
+#yields the memory addresses of a trace file in chunks (NumPy arrays if it is installed, otherwise lists of ints)
+def read_chunks(trace_file):
+    if Batch_Engine.is_available():
+        yield from Batch_Engine.read_chunks(trace_file)
+        return
+
+    chunk = []
+    for address in Trace_File.read_addresses(trace_file):
+        chunk.append(address)
+        if len(chunk) == SAMPLE_CHUNK:
+            yield chunk
+            chunk = []
+    yield chunk
+
+
+class Sampler:
+    def __init__(self, cache_hierarchy, sample_num):
+        self.cache_hierarchy = cache_hierarchy   #list of the Cache_Level objects simulated
+        self.counts = [[0] * (2 * len(cache_hierarchy) + 1) for i in range(sample_num)]   #hits and misses of each level and main memory accesses in each sample
+        self.accesses = 0   #number of accesses in the whole trace
+        self.simulated = 0   #number of accesses simulated (including warm-up)
+
+    #passes a memory address through the hierarchy, adding the result to the given counts (if any)
+    def access(self, address, counts):
+        self.simulated += 1
+        for i, cache in enumerate(self.cache_hierarchy):
+            if cache.search_cache(address):
+                if counts is not None:
+                    counts[2 * i] += 1
+                return
+            elif counts is not None:
+                counts[2 * i + 1] += 1
+
+        if counts is not None:
+            counts[-1] += 1
+
+    #works out the estimate and confidence interval of each counter from the counts of the samples and the scale factor
+    def estimate(self, scale, samples, description):
+        estimates = []
+        for column in range(2 * len(self.cache_hierarchy) + 1):
+            values = [self.counts[sample][column] for sample in range(samples)]
+            mean = sum(values) / samples if samples else 0
+            spread = math.sqrt(sum((value - mean) ** 2 for value in values) / (samples - 1)) if samples > 1 else 0
+            total = scale * samples * mean
+            margin = Z_SCORE * scale * samples * spread / math.sqrt(samples) if samples else 0
+            estimates.append((round(total), [round(max(total - margin, 0)), round(total + margin)]))
+
+        output_JSON = {"caches": [], "sampling": description}   #the same shape as output.json, with a confidence interval for every counter
+        for i, cache in enumerate(self.cache_hierarchy):
+            (hits, hits_ci), (misses, misses_ci) = estimates[2 * i], estimates[2 * i + 1]
+            output_JSON['caches'].append({"hits": hits, "misses": misses, "name": cache.name, "hits_ci": hits_ci, "misses_ci": misses_ci})
+        output_JSON['main_memory_access'], output_JSON['main_memory_access_ci'] = estimates[-1]
+
+        description['accesses'] = self.accesses
+        description['simulated_accesses'] = self.simulated
+        description['confidence'] = 0.95
+        return output_JSON
+
+
+class SetSampler(Sampler):
+    def __init__(self, cache_hierarchy, rate):
+        if rate < 1 or rate & (rate - 1):
+            raise ValueError("The set sampling rate must be a power of 2")
+
+        #a fully-associative level has no sets to sample, so it gets 1/rate of its lines instead
+        sampled_hierarchy = []
+        for cache in cache_hierarchy:
+            if cache.kind == "full" and rate > 1:
+                cache = CacheLevel(cache.name, max(cache.size // rate, cache.line_size), cache.line_size, cache.kind, cache.replacement_policy, cache.per_set_rr)
+            elif cache.kind != "full" and cache.set_num < rate * SET_GROUPS << (max(c.offset_bits for c in cache_hierarchy) - cache.offset_bits):
+                print(f"{cache.name}: has too few sets for the sampling rate times {SET_GROUPS} groups, so the groups share sets (the confidence intervals may be too narrow)")
+            sampled_hierarchy.append(cache)
+
+        super().__init__(sampled_hierarchy, SET_GROUPS)
+        self.rate = rate   #1 in every rate sets is simulated
+        self.sample_shift = max(cache.offset_bits for cache in cache_hierarchy)   #the sample and group are chosen by the address bits above every cache line offset
+        self.group_shift = self.sample_shift + rate.bit_length() - 1
+
+    #simulates the accesses to the sampled sets of the trace file
+    def run(self, trace_file):
+        rate_mask = self.rate - 1
+        for chunk in read_chunks(trace_file):
+            self.accesses += len(chunk)
+            if Batch_Engine.is_available():
+                sampled = chunk[(chunk >> Batch_Engine.np.uint64(self.sample_shift)) & Batch_Engine.np.uint64(rate_mask) == 0].tolist()
+            else:
+                sampled = [address for address in chunk if (address >> self.sample_shift) & rate_mask == 0]
+
+            for address in sampled:
+                self.access(address, self.counts[(address >> self.group_shift) % SET_GROUPS])
+
+    #estimated counters for the whole trace
+    def results(self):
+        return self.estimate(self.rate, SET_GROUPS, {"mode": "sets", "rate": self.rate, "groups": SET_GROUPS})
+
+
+class TimeSampler(Sampler):
+    def __init__(self, cache_hierarchy, period, window, warm_up):
+        if window < 1 or warm_up < 0 or window + warm_up > period:
+            raise ValueError("The sampling window and warm-up must fit in the sampling period")
+
+        super().__init__(cache_hierarchy, 0)
+        self.period = period   #number of accesses between the start of each window
+        self.window = window   #number of accesses counted in each window
+        self.warm_up = warm_up   #number of accesses simulated (but not counted) before each window
+
+    #simulates the warm-up and window of every period of the trace file
+    def run(self, trace_file):
+        start = self.period - self.window - self.warm_up   #position in the period where the warm-up starts
+        measure = self.period - self.window   #position in the period where the window starts
+
+        for chunk in read_chunks(trace_file):
+            first = self.accesses
+            self.accesses += len(chunk)
+            if Batch_Engine.is_available():   #only looks at the positions in a warm-up or window
+                positions = Batch_Engine.np.flatnonzero((Batch_Engine.np.arange(first, self.accesses) % self.period) >= start).tolist()
+                chunk = chunk.tolist()
+            else:
+                positions = [i for i in range(len(chunk)) if (first + i) % self.period >= start]
+
+            for i in positions:
+                phase = (first + i) % self.period
+                if phase >= measure:
+                    window = (first + i) // self.period
+                    while len(self.counts) <= window:   #adds the counts for each new window
+                        self.counts.append([0] * (2 * len(self.cache_hierarchy) + 1))
+                    self.access(chunk[i], self.counts[window])
+                else:
+                    self.access(chunk[i], None)
+
+    #estimated counters for the whole trace
+    def results(self):
+        complete = min(len(self.counts), self.accesses // self.period)   #only windows that were fully simulated are used
+        scale = self.accesses / (complete * self.window) if complete else 0
+        return self.estimate(scale, complete, {"mode": "time", "period": self.period, "window": self.window, "warm_up": self.warm_up, "windows": complete})
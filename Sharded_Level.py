@@ -0,0 +1,99 @@
+from multiprocessing import Pipe, Process
+
+import Batch_Engine
+
+try:
+    import numpy as np
+except ImportError:   #numpy is optional, sharding is only used by the NumPy batch engine
+    np = None
+
+'''
+This file contains the ShardedLevel Class which simulates one large cache level across several worker processes.
+
+The sets of a cache level are independent of each other (as long as round robin keeps a counter for each set), so the sets are split
+into shards (set index modulo the number of shards) and each worker process simulates its own shard with its own copy of the level.
+For every chunk, the accesses are split by shard, simulated in parallel, and the hits are put back in their original order so the
+misses reach the next level in trace order. When the simulation finishes, the counters and the contents of each shard are merged back
+into the original Cache_Level object.
+'''
+
+if np is not None:
+    NO_REPEATS = np.zeros(1, dtype=np.uint64)   #first word of a message holding only addresses
+    WITH_REPEATS = np.ones(1, dtype=np.uint64)   #first word of a message holding addresses and then the number of accesses in the run of each one
+
+
+class ShardedLevel:
+    def __init__(self, cache, shard_num):
+        self.cache = cache   #Cache_Level object being simulated
+        self.shard_num = shard_num   #number of worker processes (and shards)
+        self.workers = []   #worker process and the parent's end of its pipe for each shard
+
+        for shard in range(shard_num):
+            connection, worker_connection = Pipe()
+            worker = Process(target=shard_worker, args=(worker_connection, cache), daemon=True)   #each worker starts from a copy of the level
+            worker.start()
+            worker_connection.close()
+            self.workers.append((worker, connection))
+
+    #simulates a chunk of addresses across the shards and returns whether each access was a hit (in the original order)
+    #(along with the number of accesses in the run of each address, if given, which lfu adds to the access counts)
+    def simulate_chunk(self, addresses, repeats=None):
+        shard_of_access = ((addresses >> np.uint64(self.cache.offset_bits)) & np.uint64(self.cache.index_mask)) % np.uint64(self.shard_num)
+        order = Batch_Engine.group_order(shard_of_access, self.shard_num)   #groups the accesses by shard, keeping them in trace order within each shard
+        bounds = np.searchsorted(shard_of_access[order], np.arange(self.shard_num + 1, dtype=np.uint64))
+        sorted_addresses = addresses[order]
+        sorted_repeats = None if repeats is None else repeats[order].astype(np.uint64)
+
+        for shard, (worker, connection) in enumerate(self.workers):   #sends every shard its accesses before waiting for any of them
+            if bounds[shard] < bounds[shard + 1]:   #an empty message would tell the worker to finish, so shards without accesses are skipped
+                part = slice(bounds[shard], bounds[shard + 1])
+                if sorted_repeats is None:   #the first word says whether the repeats follow the addresses
+                    message = np.concatenate((NO_REPEATS, sorted_addresses[part]))
+                else:
+                    message = np.concatenate((WITH_REPEATS, sorted_addresses[part], sorted_repeats[part]))
+                connection.send_bytes(message.tobytes())
+
+        sorted_hits = np.empty(addresses.size, dtype=bool)
+        for shard, (worker, connection) in enumerate(self.workers):
+            if bounds[shard] < bounds[shard + 1]:
+                sorted_hits[bounds[shard]:bounds[shard + 1]] = np.frombuffer(connection.recv_bytes(), dtype=bool)
+
+        hits = np.empty(addresses.size, dtype=bool)
+        hits[order] = sorted_hits   #puts the hits back in trace order
+        return hits
+
+    #stops the workers and merges their counters and the contents of their sets into the original level
+    def finish(self):
+        for shard, (worker, connection) in enumerate(self.workers):
+            connection.send_bytes(b"")   #an empty message tells the worker to finish
+            shard_cache = connection.recv()
+            worker.join()
+            connection.close()
+
+            self.cache.hits += shard_cache.hits
+            self.cache.misses += shard_cache.misses
+            self.cache.merge_sets(shard_cache, range(shard, self.cache.set_num, self.shard_num))
+        self.workers = []
+
+
+#simulates the accesses sent to one shard until an empty message arrives, then sends back the final state of its level
+def shard_worker(connection, cache):
+    cache.hits = 0   #only the shard's own hits and misses are sent back
+    cache.misses = 0
+    engine = Batch_Engine.BatchEngine([cache])
+
+    while True:
+        message = connection.recv_bytes()
+        if not message:
+            break
+
+        words = np.frombuffer(message, dtype=np.uint64)
+        if words[0]:   #the addresses are followed by the number of accesses in the run of each one
+            addresses, repeats = np.split(words[1:], 2)
+        else:
+            addresses, repeats = words[1:], None
+        connection.send_bytes(engine.simulate_level(cache, addresses, repeats).tobytes())
+
+    engine.finish()   #releases the NumPy views of the level
+    connection.send(cache)
+    connection.close()
@@ -0,0 +1,164 @@
+from Cache_Level import SET_ASSOCIATIVE_WAYS
+
+'''
+This file contains the stack distance analysis used to sweep a least recently used cache level over a whole family of sizes in one
+pass through the trace file.
+
+The stack distance of an access is the number of distinct cache lines used since the last access to the same line. A least recently
+used cache holding N lines hits exactly when the stack distance is less than N, so one histogram of the stack distances gives the
+hits and misses of every size at once (Mattson et al.). For set-associative caches the same holds within each set, so a histogram of
+the per-set stack distances gives the hits and misses of every number of ways for a fixed number of sets.
+'''
+
+INITIAL_CAPACITY = 1 << 16   #number of time slots in the Fenwick tree before it is first compacted
+
+
+class StackDistanceTree:
+    def __init__(self, max_distance):
+        self.max_distance = max_distance   #stack distances at or above this are only counted as misses
+        self.histogram = [0] * max_distance   #number of accesses at each stack distance
+        self.last_access = {}   #time slot of the last access to each cache line
+        self.capacity = INITIAL_CAPACITY   #number of time slots in the Fenwick tree
+        self.tree = [0] * (self.capacity + 1)   #Fenwick tree marking the time slot of the last access to each cache line
+        self.time = 0   #next time slot
+
+    #records the stack distance of an access to the given cache line
+    def access(self, line):
+        if self.time == self.capacity:   #renumbers the time slots once they run out
+            self.compact()
+
+        previous = self.last_access.get(line)
+        if previous is not None:
+            #every marked slot is before the current time, so the lines used since the previous access are the marks after it
+            distance = len(self.last_access) - self.prefix_sum(previous)
+            if distance < self.max_distance:
+                self.histogram[distance] += 1
+            self.add(previous, -1)
+
+        self.add(self.time, 1)
+        self.last_access[line] = self.time
+        self.time += 1
+
+    #number of marked time slots up to and including the given one
+    def prefix_sum(self, slot):
+        tree = self.tree
+        total = 0
+        slot += 1
+        while slot > 0:
+            total += tree[slot]
+            slot &= slot - 1
+        return total
+
+    #adds the value to the given time slot
+    def add(self, slot, value):
+        tree = self.tree
+        slot += 1
+        while slot <= self.capacity:
+            tree[slot] += value
+            slot += slot & -slot
+
+    #gives the cache lines consecutive time slots in the order of their last access and rebuilds the Fenwick tree
+    def compact(self):
+        lines = sorted(self.last_access, key=self.last_access.get)
+        self.last_access = {line: slot for slot, line in enumerate(lines)}
+        self.time = len(lines)
+        self.capacity = max(self.capacity, 2 * self.time)
+
+        tree = [0] * (self.capacity + 1)
+        for slot in range(1, self.capacity + 1):   #builds the tree in linear time, passing each node's total up to its parent
+            if slot <= self.time:
+                tree[slot] += 1
+            parent = slot + (slot & -slot)
+            if parent <= self.capacity:
+                tree[parent] += tree[slot]
+        self.tree = tree
+
+    #number of hits for a cache holding the given number of lines
+    def hits(self, lines):
+        return sum(self.histogram[:min(lines, self.max_distance)])
+
+
+class SetStackDistance:
+    def __init__(self, max_ways, index_mask):
+        self.max_ways = max_ways   #largest number of ways considered (deeper stack distances are only counted as misses)
+        self.index_mask = index_mask   #mask that keeps the set index bits of a cache line number
+        self.histogram = [0] * max_ways   #number of accesses at each per-set stack distance
+        self.stacks = {}   #most recently used first list of the cache lines in each set (up to max_ways of them)
+
+    #records the per-set stack distance of an access to the given cache line
+    def access(self, line):
+        index_int = line & self.index_mask
+        stack = self.stacks.get(index_int)
+        if stack is None:
+            self.stacks[index_int] = [line]
+            return
+
+        try:
+            distance = stack.index(line)
+            self.histogram[distance] += 1
+            del stack[distance]
+        except ValueError:   #not used within the last max_ways lines of the set
+            if len(stack) == self.max_ways:
+                stack.pop()
+        stack.insert(0, line)
+
+    #number of hits for a cache with the given number of ways
+    def hits(self, ways):
+        return sum(self.histogram[:ways])
+
+
+class LevelSweep:
+    def __init__(self, cache):
+        self.name = cache['name']   #cache name
+        self.line_size = cache['line_size']   #cache line size
+        self.offset_bits = self.line_size.bit_length() - 1   #number of offset bits
+        self.sizes = sorted(cache['sizes'])   #cache sizes to report
+        self.accesses = 0   #number of accesses that reached this level
+
+        kind = cache['kind']
+        if kind != "direct" and cache.get('replacement_policy') != "lru":
+            raise ValueError(f"{self.name}: the sweep needs the lru replacement policy (or a direct mapped cache)")
+
+        #works out the number of sets and ways of each size
+        self.shapes = {}
+        for size in self.sizes:
+            line_num = size // self.line_size
+            if kind == "full":
+                self.shapes[size] = (1, line_num)
+            elif 'sets' in cache:   #a fixed number of sets with the number of ways set by the size
+                self.shapes[size] = (cache['sets'], line_num // cache['sets'])
+            elif kind == "direct" or kind in SET_ASSOCIATIVE_WAYS:   #a fixed number of ways with the number of sets set by the size
+                ways = SET_ASSOCIATIVE_WAYS.get(kind, 1)
+                self.shapes[size] = (line_num // ways, ways)
+            else:
+                raise ValueError(f"{self.name}: invalid cache kind {kind}")
+
+        #one analysis for every distinct number of sets, each deep enough for the most ways it is used with
+        depths = {}
+        for set_num, ways in self.shapes.values():
+            if set_num < 1 or set_num & (set_num - 1) or ways < 1:
+                raise ValueError(f"{self.name}: the number of sets must be a power of 2 and there must be at least one way")
+            depths[set_num] = max(ways, depths.get(set_num, 0))
+
+        self.analyses = {}
+        for set_num, depth in depths.items():
+            if set_num == 1:   #a single set has unbounded stack distances, so it uses the Fenwick tree
+                self.analyses[set_num] = StackDistanceTree(depth)
+            else:
+                self.analyses[set_num] = SetStackDistance(depth, set_num - 1)
+
+    #passes a memory address (as an int) to every analysis
+    def access(self, address):
+        self.accesses += 1
+        line = address >> self.offset_bits
+        for analysis in self.analyses.values():
+            analysis.access(line)
+
+    #hits and misses of each size
+    def results(self):
+        results = []
+        for size in self.sizes:
+            set_num, ways = self.shapes[size]
+            hits = self.analyses[set_num].hits(ways)
+            results.append((size, hits, self.accesses - hits))
+        return results
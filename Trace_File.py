@@ -0,0 +1,364 @@
+import bz2
+import gzip
+import io
+import lzma
+import math
+import mmap
+import struct
+
+'''
+This file contains the binary trace file format, the TraceReader Class which reads it, the converter from the text trace format and
+the decoding of text trace lines (one at a time, or a block at a time into a NumPy array).
+
+A binary trace file starts with a header (magic bytes, format version, flags, record size and number of records) followed by one
+fixed-width record per valid line of the text trace: the memory address as a little-endian uint64 followed by the size of the data
+as a little-endian uint16. As every record is the same width, the file can be memory-mapped and read without any parsing.
+
+Text and binary trace files can also be compressed with gzip, xz or bzip2 (recognised by their magic bytes). Compressed trace files
+are streamed through the pipeline in Trace_Pipeline.py instead of being decompressed to disk first.
+
+A compacted trace file (the COMPACTED flag) collapses each run of consecutive accesses to the same cache line into one record: the
+memory address of the first access, with the number of accesses in the run in place of the data size. The line size the runs were
+found with is kept in the header in place of the padding. Everything that reads memory addresses expands the runs again, and the
+simulator can instead apply each run to the first cache level in bulk.
+'''
+
+MAGIC = b"CSTRACE\x00"   #first 8 bytes of every binary trace file
+VERSION = 1   #version of the binary trace format
+HEADER = struct.Struct("<8sHHHHQ")   #magic, version, flags, record size, padding (line size of a compacted trace) and number of records
+RECORD = struct.Struct("<QH")   #memory address and size of the data
+MAX_SIZE = 0xFFFF   #largest data size (or number of repeats) a record can hold
+COMPACTED = 1   #flag of a compacted trace file, whose records hold runs of accesses to the same cache line
+CONVERT_BATCH = 1 << 16   #number of records packed before each write when converting
+COMPRESSED_MAGICS = {b"\x1f\x8b": gzip.open, b"\xfd7zXZ\x00": lzma.open, b"BZh": bz2.open}   #first bytes of gzip, xz and bzip2 files and the function that opens each
+
+HEX_DIGITS = 16   #maximum number of hex digits in a 64-bit memory address
+
+np = None   #NumPy, which is optional and slow to import, so it is only imported by numpy_available once the arrays are needed
+numpy_missing = False   #whether NumPy was found not to be installed
+RECORD_DTYPE = None   #packed (10 byte) NumPy view of a record
+HEX_VALUES = None   #NumPy lookup table for the value of each hex digit (255 if it isn't one)
+
+
+#checks whether the file is a binary trace file by looking at its magic bytes
+def is_binary_trace(trace_file):
+    with open(trace_file, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+#returns the function that opens the trace file if it is compressed (gzip, xz or bzip2), otherwise None
+def compressed_opener(trace_file):
+    with open(trace_file, 'rb') as file:
+        start = file.read(max(len(magic) for magic in COMPRESSED_MAGICS))
+
+    for magic, opener in COMPRESSED_MAGICS.items():
+        if start.startswith(magic):
+            return opener
+    return None
+
+#checks whether the trace file is compressed by looking at its magic bytes
+def is_compressed_trace(trace_file):
+    return compressed_opener(trace_file) is not None
+
+#opens the trace file to read its bytes, decompressing them as they are read if it is compressed
+def open_trace_bytes(trace_file):
+    opener = compressed_opener(trace_file)
+    return opener(trace_file, 'rb') if opener is not None else open(trace_file, 'rb')
+
+
+class TraceReader:
+    def __init__(self, trace_file):
+        self.file = open(trace_file, 'rb')
+
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)   #maps the whole file into memory (read only)
+            magic, version, self.flags, record_size, self.line_size, self.record_num = HEADER.unpack_from(self.map)
+        except (ValueError, struct.error):   #the file is too small to hold a header
+            self.file.close()
+            raise ValueError(f"Not a binary trace file: {trace_file}")
+
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"Not a binary trace file (or an unsupported version): {trace_file}")
+
+        if HEADER.size + self.record_num * RECORD.size > len(self.map):
+            self.close()
+            raise ValueError(f"Binary trace file is truncated: {trace_file}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    #unmaps and closes the file
+    def close(self):
+        try:
+            self.map.close()
+        except BufferError:   #an array view of the file is still in use, the mapping is closed once it is released
+            pass
+        self.file.close()
+
+    #yields the memory address and size of each record starting from the given record
+    def records(self, start=0):
+        with memoryview(self.map) as view:
+            yield from RECORD.iter_unpack(view[HEADER.size + start * RECORD.size:HEADER.size + self.record_num * RECORD.size])
+
+    #yields the memory address of each record starting from the given record (repeated for each access in the run if the trace is compacted)
+    def addresses(self, start=0):
+        if self.flags & COMPACTED:
+            for address, repeats in self.records(start):
+                for i in range(repeats):
+                    yield address
+            return
+
+        for address, size in self.records(start):
+            yield address
+
+    #yields zero-copy NumPy views (with address and size fields) of up to chunk_size records at a time
+    def chunks(self, chunk_size, start=0):
+        numpy_available()   #imports NumPy if nothing has needed it yet
+        for first in range(start, self.record_num, chunk_size):
+            count = min(chunk_size, self.record_num - first)
+            yield np.frombuffer(self.map, dtype=RECORD_DTYPE, count=count, offset=HEADER.size + first * RECORD.size)
+
+
+#decodes one line of the text trace file (as text or bytes), returning the memory address (as an int) and the size field,
+#or None if the line doesn't have the 4 required fields (it is reported as invalid), raising ValueError if the address isn't a hex number
+#and OverflowError if it doesn't fit in 64 bits
+def decode_line(line):
+    data = line.split()
+
+    if len(data) == 4:   #conditional based on whether all the required fields are present in each line
+        address = int(data[1], 16)   #reads the memory address
+        if address >> 64:
+            raise OverflowError(f"Memory address doesn't fit in 64 bits: {address:x}")
+        return address, data[3]   #along with the size of the data
+
+    if isinstance(line, bytes):
+        line = line.decode(errors='replace')
+    print(f"Invalid line: {line.strip()}")
+    return None
+
+#yields the blocks of complete lines in a stream of blocks of a text trace file, keeping an incomplete line at the end of each block for the next one
+def line_blocks(blocks):
+    leftover = b""
+    for block in blocks:
+        block = leftover + block
+        end = block.rfind(b"\n") + 1   #only complete lines are decoded, the rest is kept for the next block
+        leftover = block[end:]
+        if end:
+            yield block[:end]
+
+    if leftover:   #the last line of the file may not end with a new line
+        yield leftover
+
+#yields the memory addresses decoded from a block of lines, then raises the error of any address that couldn't be decoded
+def decode_text_block(block):
+    addresses, error = decode_text_chunk(block)
+    yield addresses   #the lines before an invalid address are still simulated
+
+    if error is not None:
+        raise error
+
+#splits a block of complete lines from the text trace file into fields and decodes the memory addresses into an array (along with any decoding error)
+def decode_text_chunk(block):
+    numpy_available()   #imports NumPy if nothing has needed it yet
+    raw = np.frombuffer(block, dtype=np.uint8)
+    space = np.ones(raw.size + 2, dtype=bool)   #whitespace (and any other control character) seperates the fields, with some assumed either side of the block
+    np.less_equal(raw, ord(" "), out=space[1:-1])
+
+    #finds the start and end of every field, which alternate along the block
+    edges = np.flatnonzero(space[1:] != space[:-1])
+    starts = edges[0::2]
+    ends = edges[1::2]
+
+    #checks that each line has the 4 required fields
+    new_lines = np.flatnonzero(raw == ord("\n"))
+    if new_lines.size == 0 or new_lines[-1] != raw.size - 1:
+        new_lines = np.append(new_lines, raw.size)   #the last line doesn't end with a new line
+    previous_new_lines = np.concatenate(([-1], new_lines[:-1]))
+
+    invalid_lines = []   #lines without the 4 required fields, reported once the block is known to decode here
+    if starts.size == 4 * new_lines.size and np.all(starts[0::4] > previous_new_lines) and np.all(starts[3::4] < new_lines):
+        address_field = np.arange(1, starts.size, 4)   #every line has exactly 4 fields and the memory address is the second one
+    else:
+        fields = np.bincount(np.searchsorted(new_lines, starts), minlength=new_lines.size)   #number of fields on each line
+        invalid_lines = np.flatnonzero(fields != 4).tolist()
+
+        first_field = np.concatenate(([0], np.cumsum(fields)[:-1]))
+        address_field = first_field[fields == 4] + 1   #the memory address is the second field
+
+    position_type = np.int32 if raw.size < 1 << 31 else np.intp   #smaller positions make the gathers below quicker
+    starts = starts[address_field].astype(position_type)
+    ends = ends[address_field].astype(position_type)
+
+    #skips the 0x prefix
+    prefixed = (ends - starts > 2) & (raw.take(starts) == ord("0")) & ((raw.take(np.minimum(starts + 1, raw.size - 1)) | 0x20) == ord("x"))
+    starts = starts + 2 * prefixed
+    lengths = ends - starts
+
+    if lengths.size == 0:
+        addresses = np.empty(0, dtype=np.uint64)
+    else:
+        if lengths.max() > HEX_DIGITS or lengths.min() == 0:
+            return decode_text_lines(block)   #addresses that don't fit in 64 bits are left to the per-line decoding
+
+        #lays the hex digits of every address out in a row of an even width, right aligned (highest digit first)
+        width = (int(lengths.max()) + 1) & ~1
+        positions = ends[:, None] + np.arange(-width, 0, dtype=position_type)
+        missing = positions < starts[:, None]   #leading zeros of the shorter addresses
+        np.copyto(positions, 0, where=missing)
+        digits = HEX_VALUES.take(raw.take(positions))
+        digits[missing] = 0
+        if np.any(digits == 255):
+            return decode_text_lines(block)   #anything that isn't a plain hex number is left to the per-line decoding
+
+        #packs each pair of digits into a byte, so the bytes of each row are the address as a big-endian 64-bit number
+        packed = np.zeros((lengths.size, 8), dtype=np.uint8)
+        packed[:, 8 - width // 2:] = (digits[:, 0::2] << 4) | digits[:, 1::2]
+        addresses = packed.view(">u8").ravel().astype(np.uint64)
+
+    for line in invalid_lines:
+        decode_line(block[previous_new_lines[line] + 1:new_lines[line]])   #reports the line as invalid
+
+    return addresses, None
+
+#decodes a block of lines one at a time (used for lines the array decoding can't handle), stopping at the first address that can't be decoded
+def decode_text_lines(block):
+    addresses = []
+    error = None
+    try:
+        for line in block.splitlines():
+            decoded = decode_line(line)
+            if decoded is not None:
+                addresses.append(decoded[0])
+    except (ValueError, OverflowError) as e:
+        error = e   #returned along with the addresses decoded before it
+
+    return np.array(addresses, dtype=np.uint64), error
+
+#imports NumPy the first time the arrays of records or memory addresses need it, returning whether it is installed
+def numpy_available():
+    global np, numpy_missing, RECORD_DTYPE, HEX_VALUES
+    if np is not None or numpy_missing:
+        return np is not None
+
+    try:
+        import numpy
+    except ImportError:
+        numpy_missing = True
+        return False
+
+    RECORD_DTYPE = numpy.dtype([("address", "<u8"), ("size", "<u2")])
+    hex_values = numpy.full(256, 255, dtype=numpy.uint8)
+    for digit in b"0123456789":
+        hex_values[digit] = digit - ord("0")
+    for digit in b"abcdef":
+        hex_values[digit] = digit - ord("a") + 10
+        hex_values[digit - 32] = digit - ord("a") + 10   #upper case digits
+    HEX_VALUES = hex_values
+    np = numpy   #set last, as the decoding thread of a pipeline may check it at the same time
+    return True
+
+#yields the memory address (as an int) of each access in a text, binary or compressed trace file
+def read_addresses(trace_file):
+    if is_compressed_trace(trace_file):
+        import Trace_Pipeline   #imported here as the pipeline itself reads the trace formats in this file
+        with Trace_Pipeline.TracePipeline(trace_file) as pipeline:
+            for chunk in pipeline.chunks():
+                yield from chunk
+        return
+
+    if is_binary_trace(trace_file):
+        with TraceReader(trace_file) as reader:
+            yield from reader.addresses()
+        return
+
+    with open(trace_file, 'r') as file:
+        for line in file:   #reads each line of the trace file
+            decoded = decode_line(line)
+            if decoded is not None:
+                yield decoded[0]
+
+
+#returns the line size a binary (possibly compressed) trace file was compacted with, or 0 if it isn't compacted (or isn't a binary trace file)
+def compaction_line_size(trace_file):
+    try:
+        with open_trace_bytes(trace_file) as file:
+            header = file.read(HEADER.size)
+    except (OSError, EOFError, lzma.LZMAError):
+        return 0
+
+    if len(header) < HEADER.size or not header.startswith(MAGIC):
+        return 0
+    magic, version, flags, record_size, line_size, record_num = HEADER.unpack(header)
+    return line_size if flags & COMPACTED else 0
+
+#yields each run of consecutive memory addresses in the same cache line (given by the offset bits) as the first address and the number of accesses
+def compact_runs(addresses, offset_bits):
+    run_line = None   #cache line of the current run
+    first = None   #memory address of the first access in the current run
+    repeats = 0   #number of accesses in the current run
+
+    try:
+        for address in addresses:
+            line = address >> offset_bits
+            if line == run_line and repeats < MAX_SIZE:
+                repeats += 1
+                continue
+
+            if repeats:
+                yield first, repeats
+            run_line = line
+            first = address
+            repeats = 1
+    except Exception:   #the run before an address that couldn't be read is still given
+        if repeats:
+            yield first, repeats
+        raise
+
+    if repeats:
+        yield first, repeats
+
+#writes a binary trace file of (memory address, size) records with the given flags and line size in its header, returning the number of records written
+def write_records(binary_file, records, flags=0, line_size=0):
+    record_num = 0
+    batch = []
+
+    with open(binary_file, 'wb') as target:
+        target.write(HEADER.pack(MAGIC, VERSION, flags, RECORD.size, line_size, 0))   #the number of records is filled in at the end
+
+        try:
+            for address, size in records:
+                batch.append(RECORD.pack(address, size))
+                if len(batch) == CONVERT_BATCH:
+                    target.write(b"".join(batch))
+                    record_num += len(batch)
+                    batch = []
+        finally:   #if a memory address can't be decoded, the records before it are kept (the simulator stops at the same line)
+            target.write(b"".join(batch))
+            record_num += len(batch)
+            target.seek(0)
+            target.write(HEADER.pack(MAGIC, VERSION, flags, RECORD.size, line_size, record_num))
+
+    return record_num
+
+#writes a compacted binary trace file of any trace file, with the runs found using the given line size, returning the number of records written
+def compact_trace(trace_file, compacted_file, line_size):
+    return write_records(compacted_file, compact_runs(read_addresses(trace_file), int(math.log2(line_size))), COMPACTED, line_size)
+
+#yields the memory address and size of the data of each valid line of the text trace file, as a binary record holds them
+def text_records(lines):
+    for line in lines:   #reads each line of the trace file
+        decoded = decode_line(line)
+        if decoded is None:
+            continue
+        mem_addr, size = decoded
+        size = int(size) if size.isdigit() else 0   #the size of the data is 0 if it isn't a number
+        yield mem_addr, min(size, MAX_SIZE)
+
+#converts a text trace file into a binary trace file, returning the number of records written
+def convert_trace(text_file, binary_file, flags=0):
+    with io.TextIOWrapper(open_trace_bytes(text_file)) as source:   #the text trace file can be compressed
+        return write_records(binary_file, text_records(source), flags)
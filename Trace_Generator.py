@@ -0,0 +1,86 @@
+import argparse
+import itertools
+import random
+
+'''
+This file contains the synthetic trace generators used by the benchmark suite.
+
+Each generator produces a deterministic (for a given seed) stream of memory addresses, which is written out in the text trace format
+read by the simulator: program counter, memory address, operation and size of the data on each line.
+'''
+
+PATTERNS = ["sequential", "strided", "random", "zipf", "pointer_chase"]   #names of the access patterns that can be generated
+BASE_ADDRESS = 0x10000000   #address of the start of the generated data
+PROGRAM_COUNTER = 0x400000   #address of the first instruction making the accesses
+ACCESS_SIZE = 8   #size of the data of each access
+
+
+#accesses consecutive words, wrapping around at the end of the footprint
+def sequential(length, footprint, rng, stride):
+    for i in range(length):
+        yield BASE_ADDRESS + (i * ACCESS_SIZE) % footprint
+
+#accesses every stride bytes, wrapping around at the end of the footprint
+def strided(length, footprint, rng, stride):
+    for i in range(length):
+        yield BASE_ADDRESS + (i * stride) % footprint
+
+#accesses uniformly random words in the footprint
+def uniform_random(length, footprint, rng, stride):
+    words = footprint // ACCESS_SIZE
+    for i in range(length):
+        yield BASE_ADDRESS + rng.randrange(words) * ACCESS_SIZE
+
+#accesses words with a Zipfian distribution, so a small hot set gets most of the accesses
+def zipf(length, footprint, rng, stride, exponent=1.0):
+    words = footprint // ACCESS_SIZE
+    cumulative = list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, words + 1)))
+    placement = list(range(words))
+    rng.shuffle(placement)   #spreads the hot words over the footprint instead of packing them at the start
+    for rank in rng.choices(range(words), cum_weights=cumulative, k=length):
+        yield BASE_ADDRESS + placement[rank] * ACCESS_SIZE
+
+#follows a random cycle of pointers, one node per stride bytes, so every access depends on the previous one
+def pointer_chase(length, footprint, rng, stride):
+    nodes = max(footprint // stride, 1)
+    order = list(range(nodes))
+    rng.shuffle(order)
+    next_node = [0] * nodes
+    for i in range(nodes):   #links the nodes into a single cycle in the shuffled order
+        next_node[order[i]] = order[(i + 1) % nodes]
+
+    node = order[0]
+    for i in range(length):
+        yield BASE_ADDRESS + node * stride
+        node = next_node[node]
+
+GENERATORS = dict(zip(PATTERNS, [sequential, strided, uniform_random, zipf, pointer_chase]))
+
+
+#yields the memory addresses of a pattern
+def generate_addresses(pattern, length, footprint=1 << 22, seed=0, stride=64):
+    return GENERATORS[pattern](length, footprint, random.Random(seed), stride)
+
+#writes a synthetic trace file in the text trace format, returning the number of lines written
+def write_trace(trace_file, pattern, length, footprint=1 << 22, seed=0, stride=64):
+    with open(trace_file, 'w') as file:
+        for i, address in enumerate(generate_addresses(pattern, length, footprint, seed, stride)):
+            operation = "W" if i % 4 == 3 else "R"   #one in every four accesses is a write
+            file.write(f"0x{PROGRAM_COUNTER + (i % 64) * 4:x} 0x{address:x} {operation} {ACCESS_SIZE}\n")
+    return length
+
+
+def main():
+    parser = argparse.ArgumentParser(description="write a synthetic trace file in the text trace format")
+    parser.add_argument("pattern", choices=PATTERNS)
+    parser.add_argument("length", type=int, help="number of accesses")
+    parser.add_argument("trace_file")
+    parser.add_argument("--footprint", type=int, default=1 << 22, help="number of bytes the accesses are spread over (default: 4 MB)")
+    parser.add_argument("--stride", type=int, default=64, help="bytes between accesses (strided) or nodes (pointer_chase) (default: 64)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    args = parser.parse_args()
+
+    write_trace(args.trace_file, args.pattern, args.length, args.footprint, args.seed, args.stride)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import queue
+import sys
+import threading
+import time
+from itertools import chain
+
+import Trace_File
+
+'''
+This file contains the TracePipeline Class which streams a compressed trace file into the simulator without decompressing it to disk.
+
+The trace file goes through three stages connected by bounded queues:
+- decompression, in a background thread, which reads blocks of the decompressed trace file
+- decoding, in a second background thread, which splits the blocks into lines (or binary records) and decodes the memory addresses of
+  each block into a chunk (a NumPy array with the batch engine, otherwise a list of ints)
+- the simulation, which takes the chunks in the thread that iterates over the pipeline
+The compression libraries release the GIL while they work, so decompression overlaps with the other stages, and as each queue only
+holds a few blocks the memory used stays the same however large the trace file is. The time each stage spends working (not waiting
+on a queue) is measured so the throughput of each stage can be reported and the bottleneck found.
+'''
+
+BLOCK_SIZE = 1 << 22   #number of decompressed bytes read at a time
+QUEUE_DEPTH = 4   #number of blocks (or chunks) each queue can hold
+QUEUE_TIMEOUT = 0.1   #seconds a stage waits on a full queue before checking whether the pipeline has been closed
+
+
+class TracePipeline:
+    def __init__(self, trace_file, as_arrays=False, block_size=BLOCK_SIZE, depth=QUEUE_DEPTH):
+        self.trace_file = trace_file   #path of the compressed trace file
+        self.as_arrays = as_arrays and Trace_File.numpy_available()   #whether the chunks are NumPy arrays (otherwise lists of ints)
+        self.block_size = block_size
+        self.blocks = queue.Queue(depth)   #decompressed blocks waiting to be decoded
+        self.decoded = queue.Queue(depth)   #chunks of memory addresses waiting to be simulated
+        self.closed = threading.Event()   #tells the background threads to stop early
+
+        #number of bytes (or accesses) each stage has produced and the seconds it has spent working
+        self.stats = {"decompress": [0, 0.0], "decode": [0, 0.0], "simulate": [0, 0.0]}
+        self.start_time = time.perf_counter()
+
+        self.threads = [threading.Thread(target=self.run_stage, args=(self.decompress, self.blocks), daemon=True),
+                        threading.Thread(target=self.run_stage, args=(self.decode, self.decoded), daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    #runs a stage, putting each item it produces in its output queue followed by None (or the error that stopped it)
+    def run_stage(self, stage, output):
+        try:
+            for item in stage():
+                if not self.put(output, item):
+                    return
+            self.put(output, None)
+        except Exception as e:
+            self.put(output, e)
+
+    #puts an item in a queue, returning False if the pipeline was closed while waiting for space
+    def put(self, output, item):
+        while not self.closed.is_set():
+            try:
+                output.put(item, timeout=QUEUE_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    #yields the items of an input queue until the stage before it finishes (raising the error it stopped with, if any)
+    def take(self, source):
+        while True:
+            try:
+                item = source.get(timeout=QUEUE_TIMEOUT)
+            except queue.Empty:
+                if self.closed.is_set():
+                    return
+                continue
+
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    #decompression stage: yields blocks of the decompressed trace file
+    def decompress(self):
+        stats = self.stats["decompress"]
+        with Trace_File.open_trace_bytes(self.trace_file) as file:
+            while True:
+                start = time.perf_counter()
+                block = file.read(self.block_size)
+                stats[1] += time.perf_counter() - start
+                if not block:
+                    return
+                stats[0] += len(block)
+                yield block
+
+    #decoding stage: yields the memory addresses of the decompressed blocks, a chunk at a time
+    def decode(self):
+        self.compacted = False   #whether the records of the binary trace file are runs of accesses to the same cache line
+        blocks = self.take(self.blocks)
+        start = b""   #start of the decompressed trace file, until it is known whether it is in the binary trace format
+        for block in blocks:
+            start += block
+            if len(start) >= Trace_File.HEADER.size or not (Trace_File.MAGIC.startswith(start) or start.startswith(Trace_File.MAGIC)):
+                break   #otherwise waits for the rest of the header
+
+        blocks = chain([start], blocks)
+        if start.startswith(Trace_File.MAGIC):
+            yield from self.decode_binary(blocks)
+        else:
+            yield from self.decode_text(blocks)
+
+    #yields the memory addresses of the blocks of a binary trace file (starting with its header), a chunk at a time
+    def decode_binary(self, blocks):
+        stats = self.stats["decode"]
+        leftover = b""   #incomplete record at the end of the last block
+        remaining = None   #number of records still to read (known once the header has been read)
+
+        for block in blocks:
+            start = time.perf_counter()
+            block = leftover + block
+            if remaining is None:
+                if len(block) < Trace_File.HEADER.size:
+                    raise ValueError(f"Binary trace file is truncated: {self.trace_file}")
+                magic, version, flags, record_size, _, remaining = Trace_File.HEADER.unpack_from(block)
+                if version != Trace_File.VERSION or record_size != Trace_File.RECORD.size:
+                    raise ValueError(f"Unsupported binary trace file version: {self.trace_file}")
+                self.compacted = bool(flags & Trace_File.COMPACTED)
+                block = block[Trace_File.HEADER.size:]
+
+            count = min(len(block) // Trace_File.RECORD.size, remaining)
+            end = count * Trace_File.RECORD.size
+            chunk = self.decode_records(block[:end], count)
+            remaining -= count
+            leftover = block[end:]
+
+            stats[0] += len(chunk)
+            stats[1] += time.perf_counter() - start
+            yield chunk
+
+    #yields the memory addresses of the blocks of a text trace file, a chunk of complete lines at a time
+    def decode_text(self, blocks):
+        stats = self.stats["decode"]
+        for lines in Trace_File.line_blocks(blocks):
+            start = time.perf_counter()
+            chunk, error = self.decode_lines(lines)
+            stats[0] += len(chunk)
+            stats[1] += time.perf_counter() - start
+            yield chunk
+            if error is not None:   #the lines before an invalid address are still simulated
+                raise error
+
+    #decodes the memory addresses of a block of binary records (repeating the address of each run for every access in it if the trace is compacted)
+    def decode_records(self, block, count):
+        if Trace_File.numpy_available():
+            records = Trace_File.np.frombuffer(block, dtype=Trace_File.RECORD_DTYPE, count=count)
+            addresses = Trace_File.np.repeat(records["address"], records["size"]) if self.compacted else records["address"].copy()
+            return addresses if self.as_arrays else addresses.tolist()
+
+        if self.compacted:
+            return [address for address, repeats in Trace_File.RECORD.iter_unpack(block) for i in range(repeats)]
+        return [address for address, size in Trace_File.RECORD.iter_unpack(block)]
+
+    #decodes the memory addresses of a block of complete lines, returning them along with any decoding error
+    def decode_lines(self, block):
+        if Trace_File.numpy_available():
+            addresses, error = Trace_File.decode_text_chunk(block)
+            return (addresses if self.as_arrays else addresses.tolist()), error
+
+        addresses = []
+        for line in block.splitlines():   #reads each line of the block
+            try:
+                decoded = Trace_File.decode_line(line)
+            except (ValueError, OverflowError) as e:
+                return addresses, e
+            if decoded is not None:
+                addresses.append(decoded[0])
+        return addresses, None
+
+    #yields the chunks of memory addresses, timing how long the simulation spends on each
+    def chunks(self):
+        stats = self.stats["simulate"]
+        for chunk in self.take(self.decoded):
+            start = time.perf_counter()
+            yield chunk
+            stats[0] += len(chunk)
+            stats[1] += time.perf_counter() - start
+
+    #stops the background threads and reports the throughput of each stage
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        for thread in self.threads:
+            thread.join()
+        self.report()
+
+    #prints the throughput of each stage on stderr (the slowest one is the bottleneck)
+    def report(self):
+        wall_time = time.perf_counter() - self.start_time
+        (decompressed, decompress_time), (decoded, decode_time), (simulated, simulate_time) = self.stats.values()
+        rate = lambda amount, seconds: amount / seconds if seconds else 0.0
+
+        print(f"Pipeline ({wall_time:.2f} s): "
+              f"decompress {rate(decompressed, decompress_time) / 1e6:.1f} MB/s ({decompress_time:.2f} s), "
+              f"decode {rate(decoded, decode_time):.0f} accesses/sec ({decode_time:.2f} s), "
+              f"simulate {rate(simulated, simulate_time):.0f} accesses/sec ({simulate_time:.2f} s)", file=sys.stderr)